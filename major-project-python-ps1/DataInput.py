@@ -1,5 +1,8 @@
 import sqlite3
 
+import pyhtml
+
+pyhtml.ensure_working_database()
 conn = sqlite3.connect("immunisation.db")
 cursor = conn.cursor()
 
@@ -54,6 +57,8 @@ personas = [
     ("Sara Ahmed", "Parent", "Urban resident", 34, "Dhaka", "Homemaker", "High School", "Mobile usage", "Child vaccination", "Reminders & info", "Healthy family", "Basic tech", "Lack of awareness", "images/persona3.jpg")
 ]
 
+# Pages pre-rendered from the old data (prerender.py) stop being served once this commits
+pyhtml.bump_content_version(conn)
 conn.commit()
 conn.close()
 
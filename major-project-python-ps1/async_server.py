@@ -0,0 +1,270 @@
+#asyncio server core for the portal.
+#Serves the same routes as pyhtml.host_site (MyRequestHandler.pages, get_page_html(form_data),
+#page_response(form_data)) but one event loop owns every connection. Idle keep-alive connections,
+#slow clients, streamed downloads and static-file sends cost a coroutine instead of a thread; only
+#page rendering and database work run on a small, bounded thread pool, and a pool thread is never
+#left waiting on a client or on another render.
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlparse
+
+import pyhtml
+import static_assets
+
+log = logging.getLogger(__name__)
+
+# Threads that run get_page_html() and its queries
+RENDER_THREADS = 8
+
+# Renders allowed to queue for those threads; further requests wait cheaply on the event loop
+MAX_PENDING_RENDERS = 64
+
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 15
+
+MAX_HEADERS = 100
+
+SERVER_NAME = "ImmunisationPortal-async"
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status.phrase)
+        self.status = status
+
+
+def error_body(code, message=None):
+    status = HTTPStatus(code)
+    return f"<html><body><h1>{code} {status.phrase}</h1><p>{message or status.description}</p></body></html>".encode("utf-8")
+
+
+class AsyncPortalServer:
+    def __init__(self, render_threads=RENDER_THREADS, max_pending=MAX_PENDING_RENDERS):
+        self.executor = ThreadPoolExecutor(max_workers=render_threads, thread_name_prefix="render")
+        self.max_pending = max_pending
+        self.pending = None  # created inside the running loop
+        self.in_flight = {}  # (path, form data) -> future of the render in progress
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except HttpError as e:
+                    await self.send_simple(writer, e.status.value, error_body(e.status.value), "text/html; charset=utf-8", False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self.respond(writer, *request)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, reader):
+        """Returns (method, target, version, headers), or None when the client closed the connection."""
+        try:
+            line = await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HttpError(HTTPStatus.REQUEST_URI_TOO_LONG)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST)
+        if not version.startswith("HTTP/1."):
+            raise HttpError(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # The portal only serves GETs, but a body still has to be consumed to keep the connection usable
+        length = headers.get("content-length", "0")
+        if not length.isdigit():
+            raise HttpError(HTTPStatus.BAD_REQUEST)
+        if int(length):
+            await reader.readexactly(int(length))
+        return method, target, version, headers
+
+    async def respond(self, writer, method, target, version, headers):
+        """Sends one response; returns whether the connection can be kept open."""
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        if method not in ("GET", "HEAD"):
+            await self.send_simple(writer, 501, error_body(501), "text/html; charset=utf-8", keep_alive, method)
+            return keep_alive
+
+        parsed_url = urlparse(target)
+        pyhtml.debugging_helper(f"A web browser wants to GET the following: {parsed_url.path}")
+        page = pyhtml.MyRequestHandler.pages.get(parsed_url.path)
+        form_data = parse_qs(parsed_url.query)
+
+        if page is not None and hasattr(page, "page_response"):
+            # Pages that produce something other than HTML (e.g. CSV downloads) give their own headers and body
+            try:
+                response = await self.run_blocking(page.page_response, form_data)
+            except Exception as e:
+                log.exception("Error sending %s: %s", parsed_url.path, e)
+                await self.send_simple(writer, 500, error_body(500), "text/html; charset=utf-8", keep_alive, method)
+                return keep_alive
+            return await self.send_streamed(writer, *response, keep_alive, method)
+
+        if page is not None and pyhtml.MyRequestHandler.prerendered is not None:
+            stored = pyhtml.MyRequestHandler.prerendered.lookup(parsed_url.path, form_data)
+            if stored is not None:
+                html_bytes, gzip_bytes = stored
+                if "gzip" in headers.get("accept-encoding", ""):
+                    extra = ["Content-Encoding: gzip", "Vary: Accept-Encoding"]
+                    await self.send_simple(writer, 200, gzip_bytes, "text/html", keep_alive, method, extra)
+                else:
+                    await self.send_simple(writer, 200, html_bytes, "text/html", keep_alive, method, ["Vary: Accept-Encoding"])
+                return keep_alive
+
+        if page is not None:
+            key = (parsed_url.path, pyhtml.normalise_form_data(form_data))
+            render = lambda: page.get_page_html(form_data).encode("utf-8")
+            try:
+                body = await self.render_once(key, render)
+            except Exception as e:
+                log.exception("Error rendering %s: %s", parsed_url.path, e)
+                await self.send_simple(writer, 500, error_body(500), "text/html; charset=utf-8", keep_alive, method)
+                return keep_alive
+            await self.send_simple(writer, 200, body, "text/html", keep_alive, method)
+            return keep_alive
+
+        asset = await self.run_blocking(static_assets.static_files.lookup, parsed_url.path)
+        if asset is None:
+            await self.send_simple(writer, 404, error_body(404), "text/html; charset=utf-8", keep_alive, method)
+            return keep_alive
+        await self.send_asset(writer, asset, headers, keep_alive, method)
+        return keep_alive
+
+    async def run_blocking(self, function, *args):
+        """Runs database/rendering work on the bounded pool without blocking the event loop."""
+        async with self.pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def render_once(self, key, render):
+        """Identical concurrent requests share one render; the others await its result here on the
+        event loop (the asyncio counterpart of pyhtml.in_flight_renders, whose followers would each
+        hold a pool thread while they wait)."""
+        render_task = self.in_flight.get(key)
+        if render_task is None:
+            render_task = asyncio.ensure_future(self.run_blocking(render))
+            self.in_flight[key] = render_task
+            render_task.add_done_callback(lambda task: self.render_done(key, task))
+        else:
+            pyhtml.debugging_helper(f"\tJoining an identical request already being rendered: {key}")
+        # shield(): a client that goes away does not cancel the render the others are waiting for
+        return await asyncio.shield(render_task)
+
+    def render_done(self, key, task):
+        del self.in_flight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here, so a render nobody waits for any more is not reported twice
+
+    async def send_streamed(self, writer, status, headers, chunks, keep_alive, method="GET"):
+        """Sends a page_response(). The body chunks are pulled one at a time on the pool and each is
+        written and drained here, so a slow client holds no thread while it catches up."""
+        # Without a Content-Length the end of the body is marked by closing the connection
+        keep_alive = keep_alive and any(name.lower() == "content-length" for name, _ in headers)
+        head = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Server: {SERVER_NAME}",
+            f"Date: {formatdate(usegmt=True)}",
+            *(f"{name}: {value}" for name, value in headers),
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        chunks = iter(chunks)
+        try:
+            while method != "HEAD":
+                chunk = await self.run_blocking(next, chunks, None)
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+            await writer.drain()
+        except Exception as e:
+            log.exception("Error streaming a response: %s", e)
+            keep_alive = False
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()  # a generator left part-way closes its database cursor now
+        return keep_alive
+
+    async def send_simple(self, writer, code, body, content_type, keep_alive, method="GET", extra_headers=()):
+        head = [
+            f"HTTP/1.1 {code} {HTTPStatus(code).phrase}",
+            f"Server: {SERVER_NAME}",
+            f"Date: {formatdate(usegmt=True)}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            *extra_headers,
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if method != "HEAD":
+            writer.write(body)
+        await writer.drain()
+
+    async def send_asset(self, writer, asset, headers, keep_alive, method):
+        """Static file response: conditional (304), ranged (206) or whole, body from memory or sendfile()."""
+        status, asset_headers, byte_range = asset.plan(headers)
+        head = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Server: {SERVER_NAME}",
+            f"Date: {formatdate(usegmt=True)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            *(f"{name}: {value}" for name, value in asset_headers),
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if method == "HEAD" or byte_range is None:
+            await writer.drain()
+            return
+        start, length = byte_range
+        if asset.body is not None:
+            writer.write(asset.body[start:start + length])
+            await writer.drain()
+        else:
+            await writer.drain()
+            with open(asset.path, "rb") as f:
+                await asyncio.get_running_loop().sendfile(writer.transport, f, start, length)
+
+    async def serve(self, PORT):
+        self.pending = asyncio.Semaphore(self.max_pending)
+        server = await asyncio.start_server(self.handle_connection, "", PORT, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+
+def host_site_async(PORT=80):
+    """Runs the portal on the asyncio core instead of socketserver threads."""
+    pyhtml.print_site_address(PORT)
+    try:
+        asyncio.run(AsyncPortalServer().serve(PORT))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,232 @@
+#One stylesheet for the whole portal, built from the per-page ones in static/css/.
+#Each page's rules are scoped to a class on its <html> element (page_class), so a page looks
+#exactly as it did with its own stylesheet. Rules that several stylesheets share word for word,
+#in the same order, are written once for all of them. The bundle is minified
+#and pages link to it by its fingerprinted URL (static_assets.asset_url), which browsers cache
+#for a year: after the first page the portal never asks for CSS again.
+#
+#   python css_bundle.py    (rebuild static/css/bundle.css; the server also does this at startup)
+#
+#Edit the per-page stylesheets, not the bundle. Pages that were pre-rendered or exported link
+#to the bundle as it was at the time, so run --prerender / --export-static again after a change.
+
+import difflib
+import os
+import re
+import threading
+
+import static_assets
+
+CSS_DIR = os.path.join("static", "css")
+PAGE_STYLESHEETS = ["1a", "1b", "2a", "2b", "3a", "3b"]
+BUNDLE_FILE = "bundle.css"
+BUNDLE_URL = "/static/css/" + BUNDLE_FILE
+
+# At-rules whose contents are ordinary rules that get scoped like the rest
+GROUPING_RULES = ("@media", "@supports")
+
+COMMENT = re.compile(r"/\*.*?\*/", re.S)
+ROOT_SELECTOR = re.compile(r"^(html|:root)(?![\w-])")
+
+_built = False
+_build_lock = threading.Lock()
+
+
+def page_class(sheet):
+    """Class for a page's <html> element, e.g. page_class("2a") -> "css-2a"."""
+    if sheet not in PAGE_STYLESHEETS:
+        raise ValueError(f"Unknown stylesheet '{sheet}'. Use one of: {', '.join(PAGE_STYLESHEETS)}")
+    return f"css-{sheet}"
+
+
+def split_top_level(text, separator):
+    """Splits on separator wherever it is not inside brackets or quotes."""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def minify_selector(selector):
+    selector = re.sub(r"\s+", " ", selector.strip())
+    return re.sub(r"\s*([>+~,])\s*", r"\1", selector)
+
+
+def minify_declarations(body):
+    """[(property, value), ...] with the whitespace squeezed out."""
+    declarations = []
+    for declaration in split_top_level(body, ";"):
+        name, colon, value = declaration.partition(":")
+        if not colon or not name.strip():
+            continue
+        value = re.sub(r"\s+", " ", value.strip())
+        value = re.sub(r"\s*,\s*", ",", value)
+        value = re.sub(r"\s*!\s*important$", "!important", value)
+        declarations.append((name.strip().lower(), value))
+    return declarations
+
+
+def parse(text, pos=0, nested=False):
+    """Parses a comment-free stylesheet into a list of items:
+        ("rule", selector, declarations)
+        ("group", prelude, [items])   for @media / @supports
+        ("raw", text)                 any other at-rule, copied as it is
+    Returns (items, position after the closing brace when nested).
+    """
+    items = []
+    while True:
+        match = re.compile(r"[{};]").search(text, pos)
+        if match is None:
+            return items, len(text)
+        prelude = text[pos:match.start()].strip()
+        if match.group() == "}":
+            if nested:
+                return items, match.end()
+            pos = match.end()  # a stray brace; browsers skip it too
+            continue
+        if match.group() == ";":
+            if prelude:
+                items.append(("raw", re.sub(r"\s+", " ", prelude) + ";"))
+            pos = match.end()
+            continue
+        if prelude.startswith(GROUPING_RULES):
+            children, pos = parse(text, match.end(), nested=True)
+            prelude = re.sub(r"\s*([:(),])\s*", r"\1", re.sub(r"\s+", " ", prelude))
+            prelude = prelude.replace(" (", "(").replace("and(", "and (")
+            items.append(("group", prelude, children))
+        elif prelude.startswith("@"):
+            end, depth = match.end(), 1
+            while depth and end < len(text):
+                depth += {"{": 1, "}": -1}.get(text[end], 0)
+                end += 1
+            items.append(("raw", re.sub(r"\s+", " ", prelude + text[match.start():end])))
+            pos = end
+        else:
+            end = text.find("}", match.end())
+            end = len(text) if end < 0 else end
+            items.append(("rule", minify_selector(prelude), minify_declarations(text[match.end():end])))
+            pos = end + 1
+
+
+def scope_selector(selector, scope):
+    """Limits a selector list to pages whose <html> matches `scope` (".css-2a" or ":is(...)")."""
+    scoped = []
+    for complex_selector in split_top_level(selector, ","):
+        root = ROOT_SELECTOR.match(complex_selector)
+        if root:
+            scoped.append("html" + scope + complex_selector[root.end():])
+        elif complex_selector.startswith("*"):
+            # * also matched the <html> element itself
+            scoped.append("html" + scope + complex_selector[1:])
+            scoped.append(scope + " " + complex_selector)
+        else:
+            scoped.append(scope + " " + complex_selector)
+    return ",".join(scoped)
+
+
+def render_rule(selector, declarations, scope):
+    body = ";".join(f"{name}:{value}" for name, value in declarations)
+    return f"{scope_selector(selector, scope)}{{{body}}}"
+
+
+def item_key(item):
+    if item[0] == "rule":
+        return "rule", item[1], tuple(item[2])
+    if item[0] == "group":
+        return "group", item[1], tuple(item_key(child) for child in item[2])
+    return item
+
+
+def merge_stylesheets(sheets):
+    """Interleaves the stylesheets into one sequence that keeps every stylesheet's own order.
+
+    Items that stylesheets have in common (matched in order, like a diff) become one entry.
+    Returns [(item, [stylesheet index, ...]), ...].
+    """
+    merged = []
+    for index, (_, items) in enumerate(sheets):
+        keys = [item_key(item) for item in items]
+        matcher = difflib.SequenceMatcher(None, [item_key(entry[0]) for entry in merged], keys, autojunk=False)
+        combined = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                for entry in merged[i1:i2]:
+                    entry[1].append(index)
+                    combined.append(entry)
+            else:
+                combined.extend(merged[i1:i2])
+                combined.extend((item, [index]) for item in items[j1:j2])
+        merged = combined
+    return merged
+
+
+def build_bundle(css_dir=CSS_DIR, stylesheets=PAGE_STYLESHEETS):
+    """The minified bundle of the given per-page stylesheets, as text."""
+    sheets = []
+    for sheet in stylesheets:
+        with open(os.path.join(css_dir, sheet + ".css"), encoding="utf-8") as f:
+            sheets.append((sheet, parse(COMMENT.sub("", f.read()))[0]))
+
+    output = []
+    for item, indexes in merge_stylesheets(sheets):
+        classes = ["." + page_class(stylesheets[index]) for index in indexes]
+        scope = classes[0] if len(classes) == 1 else f":is({','.join(classes)})"
+        if item[0] == "raw":
+            output.append(item[1])
+        elif item[0] == "group":
+            output.append(item[1] + "{" + "".join(render_rule(child[1], child[2], scope)
+                                                  for child in item[2] if child[0] == "rule") + "}")
+        else:
+            output.append(render_rule(item[1], item[2], scope))
+    header = f"/* Built by css_bundle.py from {', '.join(s + '.css' for s in stylesheets)}; edit those instead */"
+    return header + "\n" + "".join(output) + "\n"
+
+
+def write_bundle(css_dir=CSS_DIR):
+    """Rebuilds the bundle file if its content would change; returns its path."""
+    text = build_bundle(css_dir)
+    path = os.path.join(css_dir, BUNDLE_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == text:
+                return path
+    except FileNotFoundError:
+        pass
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary, path)  # a server reading the bundle never sees half of it
+    return path
+
+
+def ensure_bundle():
+    """Builds the bundle once per process."""
+    global _built
+    with _build_lock:
+        if not _built:
+            write_bundle()
+            _built = True
+
+
+def stylesheet_link():
+    """The <link> tag for the bundle, by its fingerprinted URL."""
+    ensure_bundle()
+    return f'<link rel="stylesheet" href="{static_assets.asset_url(BUNDLE_URL)}">'
+
+
+if __name__ == "__main__":
+    path = write_bundle()
+    sources = sum(os.path.getsize(os.path.join(CSS_DIR, s + ".css")) for s in PAGE_STYLESHEETS)
+    print(f"Wrote {path}: {os.path.getsize(path)} bytes from {sources} bytes of page stylesheets")
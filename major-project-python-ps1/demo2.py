@@ -1,4 +1,12 @@
+import logging
+import sys
+
 import pyhtml
+import portal_logging
+import async_server
+import css_bundle
+import prerender
+import static_export
 #Student a 
 import student_a_level_1
 import student_a_level_2
@@ -9,6 +17,20 @@ import student_b_level_1
 import student_b_level_2
 import student_b_level_3
 
+import export_data
+import search_page
+import search_suggest
+
+#Derived read tables and indexes the pages use
+import fts_index
+import infection_cube
+import lookup_keys
+import rank_tables
+import region_rollup
+import trend_series
+import trigram_index
+import wide_tables
+
 #In the studio project, the other team members would have their pages imported like this.
 # import student_b_level_1
 # import student_b_level_2
@@ -34,7 +56,51 @@ pyhtml.MyRequestHandler.pages["/page3"] = student_a_level_3    # Proogress
 pyhtml.MyRequestHandler.pages["/page4"] = student_b_level_2    # Infection
 pyhtml.MyRequestHandler.pages["/page5"] = student_b_level_1    # Mission
 pyhtml.MyRequestHandler.pages["/page6"] = student_b_level_3    # Analysis 
-#Host the site!
+pyhtml.MyRequestHandler.pages["/export"] = export_data         # CSV download of /page2 and /page4 data
+pyhtml.MyRequestHandler.pages["/search"] = search_page         # Top-nav search results
+pyhtml.MyRequestHandler.pages["/search/suggest"] = search_suggest  # Search box autocomplete (JSON)
+#Host the site! (python demo2.py [port] [worker processes] [--async] [--log-sample=N] [--prerendered])
+#--async serves from a single asyncio event loop instead of socketserver threads/processes.
+#--log-sample=N keeps only 1 in N log records below WARNING (access lines, queries).
+#--prerendered answers the finite-parameter pages from prerendered/ (python demo2.py --prerender writes it).
+#Static copy of the site: python demo2.py --export-static=DIR [--dynamic-base=URL] (see static_export.py).
+
+numbers = [int(arg) for arg in sys.argv[1:] if arg.isdigit()]
+port = numbers[0] if len(numbers) > 0 else 80
+workers = numbers[1] if len(numbers) > 1 else 1
+log_sample = next((int(arg.split("=", 1)[1]) for arg in sys.argv if arg.startswith("--log-sample=")), 1)
+
+#need_debugging_help logs every query (as row counts) at DEBUG level; records are written from a background thread
+portal_logging.setup_logging(logging.DEBUG if pyhtml.need_debugging_help else logging.INFO, sample_rate=log_sample)
+
+#The pages work on a copy of database/immunisation.db, made on the first run
+pyhtml.ensure_working_database()
+
+#Pages link to the one CSS bundle (css_bundle.py); rebuild it if a page stylesheet has changed
+css_bundle.ensure_bundle()
+
+#Build any missing derived tables and indexes now rather than in the first request that needs them,
+#so requests only read the database (and pre-rendered pages are recorded against the finished one)
+for prepare in (wide_tables.ensure_wide_tables, trigram_index.ensure_trigram_index, lookup_keys.ensure_lookup_indexes,
+                infection_cube.ensure_cube, rank_tables.ensure_ranks, trend_series.ensure_series_index, fts_index.ensure_fts):
+    pyhtml.prepare_database("immunisation.db", prepare)
+
+if "--prerender" in sys.argv:
+    count = prerender.prerender_site(pyhtml.MyRequestHandler.pages)
+    print(f"Pre-rendered {count} pages into {prerender.PRERENDER_DIR}/")
+    sys.exit(0)
+
+export_dir = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--export-static=")), None)
+if export_dir:
+    dynamic_base = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--dynamic-base=")), "")
+    written, assets = static_export.export_site(pyhtml.MyRequestHandler.pages, export_dir, dynamic_base)
+    print(f"Exported {written} pages and {assets} assets into {export_dir}")
+    sys.exit(0)
 
+if "--prerendered" in sys.argv:
+    pyhtml.MyRequestHandler.prerendered = prerender.load_prerendered()
 
-pyhtml.host_site()
+if "--async" in sys.argv:
+    async_server.host_site_async(port)
+else:
+    pyhtml.host_site(port, workers)
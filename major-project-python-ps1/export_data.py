@@ -0,0 +1,167 @@
+import csv
+import io
+import logging
+import sqlite3
+import zlib
+
+import lookup_keys
+import pyhtml
+import trigram_index
+import wide_tables
+
+log = logging.getLogger(__name__)
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Number of rows pulled from the cursor and written to the socket at a time.
+# Memory use per download is bounded by this, not by the size of the result.
+CHUNK_ROWS = 1000
+
+
+def build_vaccination_query(form_data):
+    """Builds the /page2 query (same filters as the Vaccination page) with ? placeholders."""
+    country_name = form_data.get("country", [""])[0].strip()
+    region = lookup_keys.lookup_key(form_data.get("region", [""])[0])
+    antigen_type = form_data.get("antigen_type", [""])[0].strip()
+    year = form_data.get("year", [""])[0].strip()
+
+    filters = []
+    params = []
+    if country_name:
+        condition, condition_params = trigram_index.substring_filter("V.country", "Country", country_name)
+        filters.append(condition)
+        params.extend(condition_params)
+    if region:
+        filters.append(lookup_keys.equals("V.region_name"))
+        params.append(region)
+    if antigen_type:
+        condition, condition_params = trigram_index.substring_filter("V.antigen", "Antigen", antigen_type)
+        filters.append(condition)
+        params.extend(condition_params)
+    if year.isdigit():
+        filters.append("V.year = ?")
+        params.append(int(year))
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
+
+    headers = ["Country", "Region", "Antigen", "Year", "Target Population", "Doses Administered", "Coverage Rate"]
+    query = f"""
+    SELECT V.country_name, V.region_name, V.antigen_name, V.year, V.target_num, V.doses, ROUND(V.coverage, 2)
+    FROM VaccinationWide V
+    {where_clause}
+    ORDER BY V.country_name, V.year DESC;
+    """
+    return headers, query, params
+
+
+def build_infection_query(form_data):
+    """Builds the /page4 query (same filters and summary mode as the Infection page) with ? placeholders."""
+    economic_phase = lookup_keys.lookup_key(form_data.get("economic_phase", [""])[0])
+    inf_type = form_data.get("inf_type", [""])[0].strip()
+    year = form_data.get("year", [""])[0].strip()
+    summary_mode = form_data.get("summary", ["0"])[0]
+
+    filters = []
+    params = []
+    if economic_phase:
+        filters.append(lookup_keys.equals("i.phase"))
+        params.append(economic_phase)
+    if inf_type:
+        condition, condition_params = trigram_index.substring_filter("i.inf_type", "Infection_Type", inf_type)
+        filters.append(condition)
+        params.extend(condition_params)
+    if year.isdigit():
+        filters.append("i.year = ?")
+        params.append(int(year))
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
+
+    if summary_mode == "1":
+        headers = ["Preventable Disease", "Economic Phase", "Year", "Cases"]
+        query = f"""
+        SELECT i.description, i.phase, i.year, ROUND(SUM(i.cases), 2)
+        FROM InfectionWide i
+        {where_clause}
+        GROUP BY i.description, i.phase, i.year
+        ORDER BY i.phase, i.year;
+        """
+    else:
+        headers = ["Preventable Disease", "Country", "Economic Phase", "Year", "Cases"]
+        query = f"""
+        SELECT i.description, i.country_name, i.phase, i.year, i.cases
+        FROM InfectionWide i
+        {where_clause}
+        ORDER BY i.phase, i.country_name;
+        """
+    return headers, query, params
+
+
+# dataset name -> query builder
+DATASETS = {
+    "vaccination": build_vaccination_query,
+    "infection": build_infection_query,
+}
+
+
+def iter_csv_chunks(headers, query, params, compress=False):
+    """Yields the CSV file as byte chunks, reading CHUNK_ROWS rows from the cursor at a time."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take_chunk():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(headers)
+    for rows in pyhtml.iter_result_batches(DATABASE_FILE, query, params, CHUNK_ROWS):
+        writer.writerows(rows)
+        chunk = take_chunk()
+        if chunk:
+            yield chunk
+
+    chunk = take_chunk()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def iter_download(headers, query, params, compress):
+    """iter_csv_chunks(), ending the download early (rather than failing the request) on a database error."""
+    try:
+        yield from iter_csv_chunks(headers, query, params, compress)
+    except sqlite3.Error as e:
+        # Headers are already sent, so the best we can do is log and cut the download short.
+        log.error("Database error during export: %s", e)
+
+
+def page_response(form_data):
+    """The selected dataset as a CSV (or gzipped CSV) download: (status, headers, body chunks).
+
+    The chunks are a generator that reads the next CHUNK_ROWS rows each time it is pulled, so
+    the server decides when to read more: after the client has taken the previous chunk.
+    """
+    log.debug("Streaming CSV export...")
+
+    dataset = form_data.get("dataset", ["vaccination"])[0]
+    compress = form_data.get("gzip", ["0"])[0] == "1"
+
+    if dataset not in DATASETS:
+        message = f"Unknown dataset '{dataset}'. Use one of: {', '.join(DATASETS)}"
+        return 400, [("Content-type", "text/plain; charset=utf-8")], [message.encode('utf-8')]
+
+    # Read from wide_tables' tables; the name filters go through trigram_index and lookup_keys
+    wide_tables.ensure_tables(DATABASE_FILE)
+    trigram_index.ensure_index(DATABASE_FILE)
+    lookup_keys.ensure_indexes(DATABASE_FILE)
+    headers, query, params = DATASETS[dataset](form_data)
+    filename = f"{dataset}.csv.gz" if compress else f"{dataset}.csv"
+
+    # No Content-Length: closing the connection marks the end of the file.
+    response_headers = [
+        ("Content-type", "application/gzip" if compress else "text/csv; charset=utf-8"),
+        ("Content-Disposition", f"attachment; filename=\"{filename}\""),
+    ]
+    return 200, response_headers, iter_download(headers, query, params, compress)
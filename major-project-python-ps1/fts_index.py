@@ -0,0 +1,130 @@
+import re
+import sqlite3
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# FTS5 table holding one row of searchable text per dimension row
+FTS_TABLE = "PortalText"
+
+# source table -> (id column, columns whose text is searchable)
+SOURCES = {
+    "Country": ("CountryID", ["CountryID", "name"]),
+    "Region": ("RegionID", ["RegionID", "region"]),
+    "Antigen": ("AntigenID", ["AntigenID", "name"]),
+    "Infection_Type": ("id", ["id", "description"]),
+    "Economy": ("economyID", ["phase"]),
+    # Only present once DataInput.py has been run
+    "Persona": ("PersonaID", ["Name", "Role", "Background", "Location", "Occupation", "Needs", "Goals", "PainPoints"]),
+}
+
+YEAR_PATTERN = re.compile(r"^(19|20)\d\d$")
+
+
+def text_expression(columns, prefix=""):
+    """SQL that joins the columns into one searchable string; prefix is "NEW." inside triggers."""
+    return " || ' ' || ".join(f"COALESCE({prefix}{column}, '')" for column in columns)
+
+
+def existing_sources(conn):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [table for table in SOURCES if table in tables]
+
+
+def build_fts(conn):
+    """(Re)creates the FTS5 table from the dimension tables and adds triggers that keep it in sync."""
+    conn.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+            kind UNINDEXED,
+            ref UNINDEXED,
+            body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    for table in existing_sources(conn):
+        id_column, columns = SOURCES[table]
+        conn.execute(f"INSERT INTO {FTS_TABLE} (kind, ref, body) "
+                     f"SELECT '{table}', {id_column}, {text_expression(columns)} FROM {table}")
+
+        new_text = text_expression(columns, "NEW.")
+        # One statement at a time: executescript() would commit the build half-way
+        for action in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{action}")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {FTS_TABLE} (kind, ref, body) VALUES ('{table}', NEW.{id_column}, {new_text});
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_fts_update AFTER UPDATE ON {table} BEGIN
+                DELETE FROM {FTS_TABLE} WHERE kind = '{table}' AND ref = OLD.{id_column};
+                INSERT INTO {FTS_TABLE} (kind, ref, body) VALUES ('{table}', NEW.{id_column}, {new_text});
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {FTS_TABLE} WHERE kind = '{table}' AND ref = OLD.{id_column};
+            END""")
+    conn.commit()
+
+
+def ensure_fts(conn):
+    """Builds the table the first time it is needed, and again once a source table it does not
+    cover yet has appeared (e.g. Persona, after DataInput.py): its insert trigger is missing."""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    if FTS_TABLE not in existing or any(f"{table}_fts_insert" not in existing for table in existing_sources(conn)):
+        build_fts(conn)
+
+
+def lookup(text, database=DATABASE_FILE):
+    """Resolves free text such as "measles africa 2019" to dimension IDs.
+
+    Four-digit years are returned under "year". Every other word is matched as a
+    token prefix against all dimension text, and the IDs it hits are grouped by
+    source table, best match first. A page can then AND the groups together,
+    e.g. Infection_Type IN (...) AND Region IN (...) AND year IN (...).
+    """
+    matches = {"year": []}
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if YEAR_PATTERN.match(word):
+            matches["year"].append(int(word))
+        else:
+            terms.append(word)
+    if not terms:
+        return matches
+
+    conn = sqlite3.connect(database)
+    try:
+        ensure_fts(conn)
+        for term in terms:
+            rows = conn.execute(
+                f"SELECT kind, ref FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rank",
+                ('body : "' + term + '"*',),
+            ).fetchall()
+            for kind, ref in rows:
+                ids = matches.setdefault(kind, [])
+                if ref not in ids:
+                    ids.append(ref)
+    finally:
+        conn.close()
+    return matches
+
+
+def id_filter(column, ids):
+    """Turns a lookup() group into an indexed "column IN (?, ...)" condition and its parameters."""
+    if not ids:
+        return "0", []
+    return f"{column} IN ({', '.join('?' for _ in ids)})", list(ids)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        print(lookup(" ".join(sys.argv[1:])))
+    else:
+        connection = sqlite3.connect(DATABASE_FILE)
+        build_fts(connection)
+        count = connection.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}").fetchone()[0]
+        connection.close()
+        print(f"Rebuilt {FTS_TABLE} with {count} rows.")
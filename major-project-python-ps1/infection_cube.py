@@ -0,0 +1,185 @@
+import sqlite3
+
+import lookup_keys
+import pyhtml
+import rank_tables
+import region_rollup
+import trigram_index
+import wide_tables
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Pre-aggregated (infection type x economic phase x region x year) cube over InfectionData.
+# One cell holds the summed cases and the number of reporting countries, so the
+# /page4 summary and any roll-up over these axes never has to scan the fact table.
+CUBE_TABLE = "InfectionCube"
+
+# axis name -> (cube column, label expression, dimension join)
+AXES = {
+    "inf_type": ("cube.inf_type", "it.description", "JOIN Infection_Type it ON cube.inf_type = it.id"),
+    "phase": ("cube.economy", "e.phase", "JOIN Economy e ON cube.economy = e.economyID"),
+    "region": ("cube.region", "r.region", "JOIN Region r ON cube.region = r.RegionID"),
+    "year": ("cube.year", "cube.year", ""),
+}
+
+# Aggregates a set of fact rows into cube cells. {where} narrows the fact rows being aggregated.
+CELL_QUERY = """
+    SELECT i.inf_type, c.economy, c.region, i.year, SUM(i.cases), COUNT(i.cases)
+    FROM InfectionData i
+    JOIN Country c ON i.country = c.CountryID
+    {where}
+    GROUP BY i.inf_type, c.economy, c.region, i.year
+"""
+
+
+def create_cube_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CUBE_TABLE} (
+            inf_type      TEXT (3) NOT NULL,
+            economy       INTEGER,
+            region        TEXT (3),
+            year          INTEGER  NOT NULL,
+            total_cases   REAL,
+            country_count INTEGER  NOT NULL,
+            PRIMARY KEY (inf_type, economy, region, year)
+        )
+    """)
+
+
+def build_cube(conn):
+    """Rebuilds the whole cube from InfectionData."""
+    create_cube_table(conn)
+    conn.execute(f"DELETE FROM {CUBE_TABLE}")
+    conn.execute(f"INSERT INTO {CUBE_TABLE} " + CELL_QUERY.format(where=""))
+    conn.commit()
+
+
+def ensure_cube(conn):
+    """Builds the cube the first time it is needed."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (CUBE_TABLE,)
+    ).fetchone()
+    if not exists:
+        build_cube(conn)
+
+
+def refresh_cells(conn, fact_keys):
+    """Recomputes only the cube cells touched by the given (inf_type, country, year) fact rows."""
+    create_cube_table(conn)
+    cells = set()
+    for inf_type, country, year in fact_keys:
+        row = conn.execute("SELECT economy, region FROM Country WHERE CountryID = ?", (country,)).fetchone()
+        economy, region = row if row else (None, None)
+        cells.add((inf_type, economy, region, year))
+
+    for inf_type, economy, region, year in cells:
+        conn.execute(
+            f"DELETE FROM {CUBE_TABLE} WHERE inf_type = ? AND economy IS ? AND region IS ? AND year = ?",
+            (inf_type, economy, region, year),
+        )
+        conn.execute(
+            f"INSERT INTO {CUBE_TABLE} " + CELL_QUERY.format(
+                where="WHERE i.inf_type = ? AND c.economy IS ? AND c.region IS ? AND i.year = ?"),
+            (inf_type, economy, region, year),
+        )
+
+
+def ingest_infection_data(rows, database=DATABASE_FILE):
+    """Loads (inf_type, country, year, cases) rows into InfectionData and updates the affected cube cells, rollup rows, ranks and /page4 read rows."""
+    conn = sqlite3.connect(database)
+    try:
+        ensure_cube(conn)
+        region_rollup.ensure_rollup(conn)
+        rank_tables.ensure_ranks(conn)
+        wide_tables.ensure_wide_tables(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO InfectionData (inf_type, country, year, cases) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        fact_keys = [(inf_type, country, year) for inf_type, country, year, _ in rows]
+        refresh_cells(conn, fact_keys)
+        region_rollup.refresh_nodes(conn, "cases", fact_keys)
+        rank_tables.refresh_partitions(conn, "infection_rate", [(inf_type, year) for inf_type, _, year in fact_keys])
+        wide_tables.refresh_infection_rows(conn, fact_keys)
+        pyhtml.bump_content_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def query_cube(group_by, phase=None, inf_type=None, region=None, year=None, database=DATABASE_FILE):
+    """Rolls the cube up to the given axes (any subset of AXES, in order).
+
+    Filters match the /page4 form: phase and region are case-insensitive equality,
+    inf_type is a substring of the disease name, year is exact. Each returned row is
+    the axis labels followed by the case total and the number of country records summed.
+    """
+    for axis in group_by:
+        if axis not in AXES:
+            raise ValueError(f"Unknown cube axis '{axis}'. Use any of: {', '.join(AXES)}")
+
+    # Only join the dimensions needed for labels or filters
+    used = set(group_by)
+    filters = []
+    params = []
+    if phase:
+        used.add("phase")
+        filters.append(lookup_keys.equals("e.phase"))
+        params.append(lookup_keys.lookup_key(phase))
+    if inf_type:
+        # Matched through the trigram index, so the disease names only need joining for labels
+        condition, condition_params = trigram_index.substring_filter("cube.inf_type", "Infection_Type", inf_type)
+        filters.append(condition)
+        params.extend(condition_params)
+    if region:
+        used.add("region")
+        filters.append(lookup_keys.equals("r.region"))
+        params.append(lookup_keys.lookup_key(region))
+    if year is not None and str(year).isdigit():
+        filters.append("cube.year = ?")
+        params.append(int(year))
+
+    joins = "\n".join(AXES[axis][2] for axis in AXES if axis in used)
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
+    labels = [AXES[axis][1] for axis in group_by]
+    select = ", ".join(labels + ["ROUND(SUM(cube.total_cases), 2)", "SUM(cube.country_count)"])
+    group_clause = "GROUP BY " + ", ".join(labels) if labels else ""
+    order_clause = "ORDER BY " + ", ".join(labels) if labels else ""
+
+    query = f"""
+        SELECT {select}
+        FROM {CUBE_TABLE} cube
+        {joins}
+        {where_clause}
+        {group_clause}
+        {order_clause};
+    """
+
+    conn = sqlite3.connect(database)
+    try:
+        ensure_cube(conn)
+        trigram_index.ensure_trigram_index(conn)
+        lookup_keys.ensure_lookup_indexes(conn)
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+
+def drill_down(group_by, axis, **filters):
+    """Adds one more axis to a roll-up, e.g. (phase, year) -> (phase, year, region)."""
+    return query_cube(list(group_by) + [axis], **filters)
+
+
+def roll_up(group_by, axis, **filters):
+    """Removes one axis from a roll-up, e.g. (phase, year, region) -> (phase, year)."""
+    return query_cube([a for a in group_by if a != axis], **filters)
+
+
+if __name__ == "__main__":
+    # Rebuild after a bulk load that bypassed ingest_infection_data()
+    connection = sqlite3.connect(DATABASE_FILE)
+    build_cube(connection)
+    count = connection.execute(f"SELECT COUNT(*) FROM {CUBE_TABLE}").fetchone()[0]
+    connection.close()
+    print(f"Rebuilt {CUBE_TABLE} with {count} cells.")
@@ -0,0 +1,330 @@
+#Load-testing harness for the portal.
+#Starts demo2.py against a chosen database (or targets an already running server), replays a
+#weighted mix of page, filter and static-asset requests and reports throughput and latency.
+#
+#   python loadtest.py --db immunisation.db --requests 2000 --concurrency 8 --out run.json
+#   python loadtest.py --db immunisation.db --baseline run.json      (compare with an earlier run)
+
+import argparse
+import contextlib
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import css_bundle
+import pyhtml
+import static_assets
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds to wait for the server to listen; the first start on a database builds its derived tables
+STARTUP_TIMEOUT = 600
+
+# route -> relative weight in the default traffic mix
+DEFAULT_MIX = {
+    "/": 10,
+    "/page5": 5,
+    "/page2": 25,
+    "/page3": 10,
+    "/page4": 20,
+    "/page4 summary": 10,
+    "/page6": 10,
+    "static": 10,
+}
+
+STATIC_ASSETS = [
+    "/static/css/1a.css", "/static/css/1b.css", "/static/css/2a.css",
+    "/static/css/2b.css", "/static/css/3a.css", "/static/css/3b.css",
+    "/images/rmit.png",
+]
+
+
+def static_asset_paths():
+    """STATIC_ASSETS plus the stylesheet bundle under the fingerprinted URL the pages link to."""
+    css_bundle.ensure_bundle()
+    return STATIC_ASSETS + [static_assets.asset_url(css_bundle.BUNDLE_URL)]
+
+
+def load_filter_values(database):
+    """Reads real dimension values so the generated filters hit actual data."""
+    conn = sqlite3.connect(database)
+    try:
+        values = {
+            "country": [row[0] for row in conn.execute("SELECT name FROM Country")],
+            "region": [row[0] for row in conn.execute("SELECT region FROM Region")],
+            # /page2 matches a substring of the antigen name, not its ID
+            "antigen": [row[0] for row in conn.execute("SELECT name FROM Antigen")],
+            "inf_type": [row[0] for row in conn.execute("SELECT description FROM Infection_Type")],
+            "phase": [row[0] for row in conn.execute("SELECT phase FROM Economy")],
+            "year": [row[0] for row in conn.execute("SELECT DISTINCT year FROM InfectionData")],
+        }
+    finally:
+        conn.close()
+    values["static"] = static_asset_paths()
+    return values
+
+
+def maybe(rng, value, probability=0.5):
+    return value if rng.random() < probability else ""
+
+
+def make_request_path(route, values, rng):
+    """Builds one request for a route in the mix, with a random combination of its filters."""
+    if route == "static":
+        return rng.choice(values["static"])
+    if route == "/page2":
+        form = {
+            "country": maybe(rng, rng.choice(values["country"])[:4], 0.3),
+            "region": maybe(rng, rng.choice(values["region"]), 0.3),
+            "antigen_type": maybe(rng, rng.choice(values["antigen"]), 0.3),
+            "year": maybe(rng, rng.choice(values["year"]), 0.5),
+        }
+        return "/page2?" + urlencode(form)
+    if route in ("/page4", "/page4 summary"):
+        form = {
+            "economic_phase": maybe(rng, rng.choice(values["phase"]), 0.4),
+            "inf_type": maybe(rng, rng.choice(values["inf_type"]), 0.5),
+            "year": maybe(rng, rng.choice(values["year"]), 0.5),
+        }
+        if route == "/page4 summary":
+            form["summary"] = "1"
+        return "/page4?" + urlencode(form)
+    if route in ("/page3", "/page6"):
+        form = {"inf_type": rng.choice(values["inf_type"]), "year": rng.choice(values["year"])}
+        return route + "?" + urlencode(form)
+    return route
+
+
+def build_plan(mix, values, total, seed):
+    """The full, reproducible list of (route, path) requests for a run."""
+    rng = random.Random(seed)
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    return [(route, make_request_path(route, values, rng))
+            for route in rng.choices(routes, weights=weights, k=total)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_workdir(database, prefix="loadtest-"):
+    """A scratch directory laid out like the project, with immunisation.db pointing at the chosen database."""
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.symlink(os.path.abspath(database), os.path.join(workdir, "immunisation.db"))
+    for folder in ("static", "images"):
+        os.symlink(os.path.join(PROJECT_DIR, folder), os.path.join(workdir, folder))
+    return workdir
+
+
+def remove_workdir(workdir):
+    """Deletes a make_workdir() directory; the symlinks go, what they point at stays."""
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def in_workdir(database, prefix="loadtest-"):
+    """Runs the block inside a make_workdir() directory and removes it afterwards."""
+    start_dir = os.getcwd()
+    workdir = make_workdir(database, prefix)
+    os.chdir(workdir)
+    try:
+        yield workdir
+    finally:
+        os.chdir(start_dir)
+        remove_workdir(workdir)
+
+
+def start_server(database, port, workers=1):
+    """Runs demo2.py in a scratch directory where immunisation.db is the chosen database.
+
+    Returns (process, workdir); remove the workdir with remove_workdir() once the server has stopped.
+    """
+    workdir = make_workdir(database)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(PROJECT_DIR, "demo2.py"), str(port), str(workers)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server, workdir
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    server.wait()
+    remove_workdir(workdir)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def fetch(host, port, path, timeout):
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        size = len(response.read())
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        size, status = 0, None
+    finally:
+        conn.close()
+    return time.perf_counter() - started, size, status
+
+
+def run_plan(host, port, plan, concurrency, timeout):
+    """Replays the plan with `concurrency` client threads; returns (samples, wall-clock seconds)."""
+    samples = []
+    lock = threading.Lock()
+    position = [0]
+
+    def worker():
+        while True:
+            with lock:
+                if position[0] >= len(plan):
+                    return
+                route, path = plan[position[0]]
+                position[0] += 1
+            latency, size, status = fetch(host, port, path, timeout)
+            with lock:
+                samples.append((route, latency, size, status))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarise(samples, elapsed):
+    def stats(group):
+        latencies = sorted(latency for _, latency, _, _ in group)
+        sizes = [size for _, _, size, _ in group]
+        return {
+            "requests": len(group),
+            "errors": sum(1 for _, _, _, status in group if status is None or status >= 400),
+            "rps": round(len(group) / elapsed, 2) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            "mean_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+        }
+
+    routes = sorted({route for route, _, _, _ in samples})
+    return {
+        "overall": stats(samples),
+        "routes": {route: stats([s for s in samples if s[0] == route]) for route in routes},
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"{'route':<16}{'reqs':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'bytes':>9}")
+    rows = [("overall", report["overall"])] + list(report["routes"].items())
+    for route, stats in rows:
+        line = (f"{route:<16}{stats['requests']:>7}{stats['errors']:>5}{stats['rps']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['mean_bytes']:>9}")
+        if baseline:
+            old = baseline["overall"] if route == "overall" else baseline["routes"].get(route)
+            if old and old.get("rps") and old.get("p95_ms"):
+                line += (f"   rps {100 * (stats['rps'] - old['rps']) / old['rps']:+.1f}%"
+                         f"  p95 {100 * (stats['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.1f}%")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a traffic mix against the portal and report throughput.")
+    parser.add_argument("--db", default=os.path.join(PROJECT_DIR, "immunisation.db"), help="database to serve")
+    parser.add_argument("--url", help="host:port of an already running server (skips starting one)")
+    parser.add_argument("--requests", type=int, default=1000, help="total requests to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes (pre-fork mode if > 1)")
+    parser.add_argument("--mix", help="JSON file of {route: weight} replacing the default mix")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the request plan")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.db == parser.get_default("db"):
+        pyhtml.ensure_working_database(args.db, os.path.join(PROJECT_DIR, pyhtml.SOURCE_DATABASE))
+
+    mix = DEFAULT_MIX
+    if args.mix:
+        with open(args.mix) as f:
+            mix = json.load(f)
+
+    plan = build_plan(mix, load_filter_values(args.db), args.requests, args.seed)
+
+    server = workdir = None
+    if args.url:
+        host, port = args.url.rsplit(":", 1)
+        port = int(port)
+    else:
+        host, port = "127.0.0.1", free_port()
+        server, workdir = start_server(args.db, port, args.workers)
+
+    try:
+        # A few untimed requests so first-use work (index builds, imports) is not measured
+        for _, path in plan[:5]:
+            fetch(host, port, path, args.timeout)
+        samples, elapsed = run_plan(host, port, plan, args.concurrency, args.timeout)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+            remove_workdir(workdir)
+
+    report = summarise(samples, elapsed)
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "database": os.path.abspath(args.db),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "seed": args.seed,
+        "mix": mix,
+        "elapsed_s": round(elapsed, 3),
+        **report,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pyhtml
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Case-insensitive equality filters on dimension names ("oceania" finds the region "Oceania").
+# Each name column gets an index in NOCASE collation, and a filter is written as
+# "column = ? COLLATE NOCASE" with the typed value trimmed in Python, so SQLite seeks the
+# index. Wrapping the column in TRIM(LOWER(...)) instead made it test every row.
+# NOCASE folds ASCII letters only, the same as LOWER().
+
+# dimension table -> name column
+LOOKUP_COLUMNS = {
+    "Region": "region",
+    "Economy": "phase",
+    "Country": "name",
+    "Antigen": "name",
+    "Infection_Type": "description",
+}
+
+# The joins from a matched region or phase down to its countries and their infection rows,
+# so those are seeks too (trigram_index adds the Vaccination ones)
+JOIN_INDEXES = {
+    "Country_region": ("Country", "region"),
+    "Country_economy": ("Country", "economy"),
+    "InfectionData_country": ("InfectionData", "country, year"),
+}
+
+
+def lookup_key(text):
+    """Normalises typed input once, before it reaches SQL."""
+    return (text or "").strip()
+
+
+def equals(column):
+    """An indexed case-insensitive "column = ?" condition; pass lookup_key(value) as its parameter."""
+    return f"{column} = ? COLLATE NOCASE"
+
+
+def create_lookup_indexes(conn):
+    for table, column in LOOKUP_COLUMNS.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column}_nocase ON {table} ({column} COLLATE NOCASE)")
+    for name, (table, columns) in JOIN_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    conn.commit()
+
+
+def ensure_lookup_indexes(conn):
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    wanted = {f"{table}_{column}_nocase" for table, column in LOOKUP_COLUMNS.items()} | set(JOIN_INDEXES)
+    if not wanted <= existing:
+        create_lookup_indexes(conn)
+
+
+def ensure_indexes(database=DATABASE_FILE):
+    """ensure_lookup_indexes() for pages that query through pyhtml; checks the database once per version."""
+    pyhtml.prepare_database(database, ensure_lookup_indexes)
+
+
+if __name__ == "__main__":
+    connection = sqlite3.connect(DATABASE_FILE)
+    create_lookup_indexes(connection)
+    connection.close()
+    print(f"Created the lookup indexes on {', '.join(LOOKUP_COLUMNS)}.")
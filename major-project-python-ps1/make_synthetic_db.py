@@ -0,0 +1,215 @@
+#Synthetic data generator for capacity testing.
+#Builds a database with the same schema as immunisation.db but 10x, 100x or 1000x the fact rows,
+#by splitting every country into districts (stored as pseudo-countries), every region into
+#sub-regions, extending the year range backwards and adding antigen / infection-type variants.
+#Values are sampled around the real figures so the distributions stay realistic.
+#
+#   python make_synthetic_db.py --scale 100                  (writes immunisation_x100.db)
+#   python make_synthetic_db.py --scale 10 --out test.db --seed 7
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import pyhtml
+
+# Tables copied (schema + generated rows) from the source database
+BASE_TABLES = ["Infection_Type", "Antigen", "Economy", "Region", "Country", "YearDate",
+               "CountryPopulation", "Vaccination", "InfectionData"]
+
+# Copied as-is when present
+EXTRA_TABLES = ["Team", "Persona"]
+
+# scale -> how the growth is split. Fact rows grow by roughly
+# districts x (years / 25) x variants, where variants multiplies the antigens and infection types.
+PRESETS = {
+    10: {"districts": 5, "years": 50, "variants": 1, "subregions": 2},
+    100: {"districts": 25, "years": 50, "variants": 2, "subregions": 4},
+    1000: {"districts": 125, "years": 100, "variants": 2, "subregions": 8},
+}
+
+BATCH_ROWS = 10000
+
+
+def load_source(conn):
+    """Reads the real data that the synthetic rows are sampled around."""
+    source = {
+        "inf_types": conn.execute("SELECT id, description FROM Infection_Type").fetchall(),
+        "antigens": conn.execute("SELECT AntigenID, name FROM Antigen").fetchall(),
+        "economies": conn.execute("SELECT economyID, phase FROM Economy").fetchall(),
+        "regions": conn.execute("SELECT RegionID, region FROM Region").fetchall(),
+        "countries": conn.execute("SELECT CountryID, name, region, economy FROM Country").fetchall(),
+        "years": [row[0] for row in conn.execute("SELECT YearID FROM YearDate ORDER BY YearID")],
+    }
+    source["population"] = {(c, y): p for c, y, p in conn.execute("SELECT country, year, population FROM CountryPopulation")}
+    source["cases"] = {(t, c, y): n for t, c, y, n in conn.execute("SELECT inf_type, country, year, cases FROM InfectionData")}
+    source["vaccination"] = {}
+    for inf_type, antigen, country, year, target, doses, coverage in conn.execute("SELECT * FROM Vaccination"):
+        source["vaccination"].setdefault((antigen, country), {})[year] = (inf_type, target, doses, coverage)
+    return source
+
+
+def create_schema(source_conn, out_conn):
+    for table in BASE_TABLES + EXTRA_TABLES:
+        row = source_conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if row:
+            out_conn.execute(row[0])
+
+
+def source_year(year, years):
+    """Maps a synthetic year onto a real one, repeating the real range backwards."""
+    first = years[0]
+    return year if year >= first else first + (year - first) % len(years)
+
+
+def variant_id(code, variant):
+    return code if variant == 0 else f"{code}{variant + 1}"
+
+
+def variant_name(name, variant):
+    return name if variant == 0 else f"{name} (variant {variant + 1})"
+
+
+def generate(source, out_conn, districts, years, variants, subregions, rng):
+    last_year = source["years"][-1]
+    all_years = list(range(last_year - years + 1, last_year + 1))
+
+    # --- Dimensions ---
+    inf_types = [(variant_id(t, v), variant_name(d, v)) for v in range(variants) for t, d in source["inf_types"]]
+    antigens = [(variant_id(a, v), variant_name(n, v)) for v in range(variants) for a, n in source["antigens"]]
+    regions = [(f"{r}{s}" if s else r, f"{name} {s + 1}" if s else name) for r, name in source["regions"] for s in range(subregions)]
+
+    # Each district gets a fixed share of its country's population (skewed, like real districts)
+    district_rows = []
+    shares = {}
+    for country_id, name, region, economy in source["countries"]:
+        weights = [rng.lognormvariate(0, 0.8) for _ in range(districts)]
+        total = sum(weights)
+        for d in range(districts):
+            district_id = country_id if districts == 1 else f"{country_id}-{d + 1:03d}"
+            district_name = name if districts == 1 else f"{name} District {d + 1}"
+            sub = rng.randrange(subregions)
+            district_rows.append((district_id, district_name, f"{region}{sub}" if sub else region, economy))
+            shares[district_id] = (country_id, weights[d] / total)
+
+    out_conn.executemany("INSERT INTO Infection_Type VALUES (?, ?)", inf_types)
+    out_conn.executemany("INSERT INTO Antigen VALUES (?, ?)", antigens)
+    out_conn.executemany("INSERT INTO Economy VALUES (?, ?)", source["economies"])
+    out_conn.executemany("INSERT INTO Region VALUES (?, ?)", regions)
+    out_conn.executemany("INSERT INTO Country VALUES (?, ?, ?, ?)", district_rows)
+    out_conn.executemany("INSERT INTO YearDate VALUES (?)", [(y,) for y in all_years])
+
+    # --- Facts, generated lazily and inserted in batches ---
+    def drift(year):
+        """Years before the real range: fewer vaccinations and more cases, a little further back each year."""
+        return max(0, source["years"][0] - year)
+
+    def population_rows():
+        for district_id, (country_id, share) in shares.items():
+            for year in all_years:
+                population = source["population"].get((country_id, source_year(year, source["years"])))
+                if population is not None:
+                    population = round(population * share * (0.99 ** drift(year)))
+                yield district_id, year, population
+
+    def infection_rows():
+        for v in range(variants):
+            for inf_type, _ in source["inf_types"]:
+                for district_id, (country_id, share) in shares.items():
+                    for year in all_years:
+                        cases = source["cases"].get((inf_type, country_id, source_year(year, source["years"])))
+                        if cases is None:
+                            continue
+                        noisy = cases * share * rng.lognormvariate(0, 0.5) * (1.03 ** drift(year))
+                        yield variant_id(inf_type, v), district_id, year, round(noisy)
+
+    def vaccination_rows():
+        for v in range(variants):
+            for antigen, _ in source["antigens"]:
+                for district_id, (country_id, share) in shares.items():
+                    by_year = source["vaccination"].get((antigen, country_id), {})
+                    for year in all_years:
+                        real = by_year.get(source_year(year, source["years"]))
+                        if real is None:
+                            continue
+                        inf_type, target, doses, coverage = real
+                        # Missing figures are stored as '' in the real data; keep them missing
+                        if not isinstance(coverage, (int, float)) or not isinstance(target, (int, float)):
+                            yield variant_id(inf_type, v), variant_id(antigen, v), district_id, year, target, doses, coverage
+                            continue
+                        coverage = min(120.0, max(1.0, coverage - 0.8 * drift(year) + rng.gauss(0, 4)))
+                        target = round(target * share)
+                        yield (variant_id(inf_type, v), variant_id(antigen, v), district_id, year,
+                               target, round(target * coverage / 100), round(coverage, 2))
+
+    for table, placeholders, rows in (
+        ("CountryPopulation", "?, ?, ?", population_rows()),
+        ("InfectionData", "?, ?, ?, ?", infection_rows()),
+        ("Vaccination", "?, ?, ?, ?, ?, ?, ?", vaccination_rows()),
+    ):
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                out_conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", batch)
+                count += len(batch)
+                batch = []
+        out_conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", batch)
+        count += len(batch)
+        print(f"  {table}: {count:,} rows")
+
+
+def make_database(source_path, out_path, districts, years, variants, subregions, seed):
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    source_conn = sqlite3.connect(source_path)
+    out_conn = sqlite3.connect(out_path)
+    try:
+        # Bulk load: durability does not matter until the file is finished
+        out_conn.execute("PRAGMA journal_mode = OFF")
+        out_conn.execute("PRAGMA synchronous = OFF")
+        create_schema(source_conn, out_conn)
+        for table in EXTRA_TABLES:
+            if source_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                rows = source_conn.execute(f"SELECT * FROM {table}").fetchall()
+                if rows:
+                    out_conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in rows[0])})", rows)
+        generate(load_source(source_conn), out_conn, districts, years, variants, subregions, random.Random(seed))
+        pyhtml.bump_content_version(out_conn)
+        out_conn.commit()
+        out_conn.execute("ANALYZE")
+        out_conn.commit()
+    finally:
+        source_conn.close()
+        out_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a scaled-up, schema-compatible immunisation database.")
+    parser.add_argument("--scale", type=int, choices=sorted(PRESETS), default=10, help="preset growth factor")
+    parser.add_argument("--source", default=pyhtml.SOURCE_DATABASE, help="database to sample from (default: the shipped one)")
+    parser.add_argument("--out", help="output file (default: immunisation_x<scale>.db)")
+    parser.add_argument("--districts", type=int, help="districts per country (overrides the preset)")
+    parser.add_argument("--years", type=int, help="number of years, ending at the latest real year (overrides the preset)")
+    parser.add_argument("--variants", type=int, help="copies of each antigen and infection type (overrides the preset)")
+    parser.add_argument("--subregions", type=int, help="sub-regions per region (overrides the preset)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    preset = dict(PRESETS[args.scale])
+    for key in preset:
+        if getattr(args, key) is not None:
+            preset[key] = getattr(args, key)
+    out_path = args.out or f"immunisation_x{args.scale}.db"
+
+    print(f"Generating {out_path} from {args.source} with {preset}...")
+    started = time.time()
+    make_database(args.source, out_path, seed=args.seed, **preset)
+    print(f"Done in {time.time() - started:.1f}s ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+#Storage migrations for immunisation.db, with a before/after measurement of every page.
+#
+#--layout chooses how the fact tables are stored:
+#   rowid      the schema as shipped: a rowid table plus a separate index for its primary key
+#   clustered  WITHOUT ROWID tables whose primary key is the order the pages read them in, so
+#              rows come off the table already in that order (no temporary B-tree sort, no
+#              index-to-row lookups). The original key stays enforced by a UNIQUE index where
+#              the clustered key uses different columns.
+#
+#The page_bench.py cases are timed and their query plans captured before and after, and the
+#change is printed per page (--plans also prints the plans that changed).
+#
+#   python migrate_db.py --layout clustered
+#   python migrate_db.py --layout rowid --db immunisation_x100.db --plans
+#   python migrate_db.py --layout clustered --no-measure
+
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import re
+import sqlite3
+import sys
+
+import loadtest
+import page_bench
+import pyhtml
+import wide_tables
+
+DATABASE_FILE = 'immunisation.db'
+
+# table -> primary key, per layout. VaccinationWide stays a rowid table: its rows are wide and
+# /page2 mostly reaches them through its region/antigen/country indexes, where a lookup by a long
+# text key cost more than the sorted listing saved.
+LAYOUTS = {
+    "rowid": {
+        "Vaccination": "inf_type, antigen, country, year",
+        "InfectionData": "inf_type, country, year",
+        "CountryPopulation": "country, year",
+        wide_tables.INFECTION_WIDE: ", ".join(wide_tables.TABLES[wide_tables.INFECTION_WIDE][1]),
+    },
+    "clustered": {
+        # rank_tables and region_rollup group it by antigen, country, year
+        "Vaccination": "antigen, country, year, inf_type",
+        # /page3 and /page6 read one year (and infection type) at a time
+        "InfectionData": "year, inf_type, country",
+        # every rate query joins it on (country, year)
+        "CountryPopulation": "country, year",
+        # /page4 lists ORDER BY phase, country_name
+        wide_tables.INFECTION_WIDE: "phase, country_name, inf_type, year",
+    },
+}
+
+TABLE_KEY = re.compile(r",\s*PRIMARY\s+KEY\s*\([^)]*\)", re.I)
+
+
+def key_columns(key):
+    return [part.split()[0] for part in key.split(",")]
+
+
+def table_layout(conn, table):
+    """(primary key columns in order, WITHOUT ROWID?) as the table is stored now."""
+    columns = sorted((row[5], row[1]) for row in conn.execute(f"PRAGMA table_info({table})") if row[5])
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    return [name for _, name in columns], bool(re.search(r"\)\s*WITHOUT\s+ROWID\s*$", sql, re.I))
+
+
+def rebuild_table(conn, table, key, without_rowid):
+    """Copies the table into a new one with the given primary key and storage, keeping its
+    columns, indexes and triggers."""
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    natural_key = LAYOUTS["rowid"][table]
+    unique_key = f"{table}_key"
+    extras = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL AND name != ?",
+        (table, unique_key))]
+
+    body = re.sub(r"\)\s*(WITHOUT\s+ROWID\s*)?$", "", sql.strip(), flags=re.I)
+    body = TABLE_KEY.sub("", body)
+    body = re.sub(rf"^CREATE\s+TABLE\s+\"?{table}\"?", f"CREATE TABLE {table}_migrating", body, flags=re.I)
+    conn.execute(f"{body}, PRIMARY KEY ({key}))" + (" WITHOUT ROWID" if without_rowid else ""))
+
+    columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+    # Inserting in key order writes the new B-tree sequentially, leaving its pages full
+    conn.execute(f"INSERT INTO {table}_migrating ({columns}) SELECT {columns} FROM {table} ORDER BY {key}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_migrating RENAME TO {table}")
+    for statement in extras:
+        conn.execute(statement)
+    if set(key_columns(key)) != set(key_columns(natural_key)):
+        conn.execute(f"CREATE UNIQUE INDEX {unique_key} ON {table} ({natural_key})")
+
+
+def migrate_layout(database, layout):
+    """Rebuilds every table whose storage differs from the layout; returns the tables changed."""
+    conn = sqlite3.connect(database)
+    changed = []
+    try:
+        wide_tables.ensure_wide_tables(conn)
+        conn.execute("BEGIN")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table, key in LAYOUTS[layout].items():
+            if table not in tables or table_layout(conn, table) == (key_columns(key), layout == "clustered"):
+                continue
+            rebuild_table(conn, table, key, layout == "clustered")
+            changed.append(table)
+        conn.commit()
+        if changed:
+            conn.execute("VACUUM")  # hand the old tables' pages back
+    finally:
+        conn.close()
+    return changed
+
+
+@contextlib.contextmanager
+def recording_queries(statements):
+    """Collects every (sql, params) the pages execute while active."""
+    real_connect = sqlite3.connect
+
+    class RecordingCursor(sqlite3.Cursor):
+        def execute(self, sql, params=()):
+            statements.append((sql, tuple(params)))
+            return super().execute(sql, params)
+
+    class RecordingConnection(sqlite3.Connection):
+        def cursor(self, factory=RecordingCursor):
+            return super().cursor(factory)
+
+        def execute(self, *args):
+            return self.cursor().execute(*args)
+
+    def connect(*args, **kwargs):
+        kwargs.setdefault("factory", RecordingConnection)
+        return real_connect(*args, **kwargs)
+
+    sqlite3.connect = connect
+    try:
+        yield
+    finally:
+        sqlite3.connect = real_connect
+
+
+def query_plans(statements, database):
+    """EXPLAIN QUERY PLAN of each distinct SELECT, as {normalised sql: [plan lines]}."""
+    plans = {}
+    conn = sqlite3.connect(database)
+    try:
+        for sql, params in statements:
+            query = pyhtml.normalise_sql(sql)
+            if query in plans or not query.upper().startswith(("SELECT", "WITH")):
+                continue
+            try:
+                plans[query] = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            except sqlite3.Error as e:
+                plans[query] = [f"error: {e}"]
+    finally:
+        conn.close()
+    return plans
+
+
+def measure(database, repeat, only=None):
+    """Times every page_bench case and records its query plans; returns {case: result}."""
+    results = {}
+    saved_cache = pyhtml.query_cache
+    # Cached results would hide the storage change; nothing is cached while measuring
+    pyhtml.query_cache = pyhtml.QueryCache(0, 0)
+    try:
+        with loadtest.in_workdir(database, "migrate-"):
+            for name, module_name, form_data in page_bench.CASES:
+                if only and only not in name:
+                    continue
+                page = importlib.import_module(module_name)
+                try:
+                    timing = page_bench.run_case(page, form_data, repeat)
+                    statements = []
+                    with recording_queries(statements), contextlib.redirect_stdout(io.StringIO()):
+                        page.get_page_html(form_data)
+                except Exception as e:
+                    results[name] = {"error": str(e)}
+                    continue
+                results[name] = {"total_ms": timing["total_ms"], "plans": query_plans(statements, "immunisation.db")}
+    finally:
+        pyhtml.query_cache = saved_cache
+    return results
+
+
+def plan_counts(plans):
+    lines = [line for plan in plans.values() for line in plan]
+    return sum("TEMP B-TREE" in line for line in lines), sum(line.startswith("SCAN") for line in lines)
+
+
+def print_report(before, after, show_plans=False):
+    print(f"{'case':<30}{'before ms':>10}{'after ms':>10}{'change':>8}{'sorts':>8}{'scans':>8}")
+    for name in before:
+        old, new = before[name], after.get(name, {})
+        if "error" in old or "error" in new:
+            print(f"{name:<30}failed: {old.get('error') or new.get('error')}")
+            continue
+        change = (new["total_ms"] - old["total_ms"]) / old["total_ms"] if old["total_ms"] else 0
+        old_sorts, old_scans = plan_counts(old["plans"])
+        new_sorts, new_scans = plan_counts(new["plans"])
+        print(f"{name:<30}{old['total_ms']:>10}{new['total_ms']:>10}{change:>+8.0%}"
+              f"{f'{old_sorts}->{new_sorts}':>8}{f'{old_scans}->{new_scans}':>8}")
+        if show_plans:
+            for query, plan in new["plans"].items():
+                if old["plans"].get(query) != plan:
+                    print(f"    {query[:100]}")
+                    for line in old["plans"].get(query, []):
+                        print(f"      - {line}")
+                    for line in plan:
+                        print(f"      + {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the storage of immunisation.db and measure the effect on every page.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="database to migrate in place")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), required=True, help="storage layout of the fact tables")
+    parser.add_argument("--no-measure", action="store_true", help="migrate without timing the pages")
+    parser.add_argument("--repeat", type=int, default=10, help="timed calls per page case")
+    parser.add_argument("--only", help="measure only cases whose name contains this text")
+    parser.add_argument("--plans", action="store_true", help="print the query plans that changed")
+    args = parser.parse_args()
+    if args.db == DATABASE_FILE:
+        pyhtml.ensure_working_database()
+    args.db = os.path.abspath(args.db)
+    sys.path.insert(0, page_bench.PROJECT_DIR)
+
+    before = None if args.no_measure else measure(args.db, args.repeat, args.only)
+    size = os.path.getsize(args.db)
+    changed = migrate_layout(args.db, args.layout)
+    print(f"{args.layout} layout: rebuilt {', '.join(changed) or 'nothing (already in this layout)'}; "
+          f"file {size / 1048576:.1f} MiB -> {os.path.getsize(args.db) / 1048576:.1f} MiB\n")
+    if before is not None:
+        print_report(before, measure(args.db, args.repeat, args.only), args.plans)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#Per-page micro-benchmarks.
+#Calls every page module's get_page_html(form_data) directly with a fixed set of representative
+#filters, splits the time into query (inside sqlite3) and render (everything else), records peak
+#memory allocated per call, and fails if a page got slower or hungrier than the stored baseline.
+#pyhtml's query cache is cleared before every timed call, so each one runs its queries (cold).
+#A case that should list data but renders no rows also fails: it would only time an empty page.
+#
+#   python page_bench.py --save-baseline           (record page_bench_baseline.json)
+#   python page_bench.py                           (compare against it; exit code 1 on regression
+#                                                   or when there is no baseline to compare against)
+#   python page_bench.py --db immunisation.db --db immunisation_x10.db --db immunisation_x100.db
+#                                                  (how each page scales with make_synthetic_db.py data)
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+
+import loadtest
+import pyhtml
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(PROJECT_DIR, "page_bench_baseline.json")
+
+# (case name, page module, form_data) -- form_data is what parse_qs would produce
+CASES = [
+    ("home", "student_a_level_1", {}),
+    ("mission", "student_b_level_1", {}),
+    ("vaccination all", "student_a_level_2", {}),
+    ("vaccination country", "student_a_level_2", {"country": ["Aus"]}),
+    ("vaccination region+year", "student_a_level_2", {"region": ["South Asia"], "year": ["2020"]}),
+    ("vaccination antigen+year", "student_a_level_2", {"antigen_type": ["Measles"], "year": ["2019"]}),
+    ("infection all", "student_b_level_2", {}),
+    ("infection phase", "student_b_level_2", {"economic_phase": ["Low Income"]}),
+    ("infection type+year", "student_b_level_2", {"inf_type": ["Measles"], "year": ["2019"]}),
+    ("infection summary", "student_b_level_2", {"summary": ["1"]}),
+    ("infection summary filtered", "student_b_level_2", {"summary": ["1"], "economic_phase": ["High Income"], "year": ["2015"]}),
+    ("progress empty", "student_a_level_3", {}),
+    ("progress measles 2019", "student_a_level_3", {"inf_type": ["Measles"], "year": ["2019"]}),
+    ("analysis empty", "student_b_level_3", {}),
+    ("analysis measles 2019", "student_b_level_3", {"inf_type": ["Measles"], "year": ["2019"]}),
+    ("search", "search_page", {"q": ["south"]}),
+]
+
+# page module -> text that appears once per data row it lists
+ROW_MARKERS = {
+    "student_a_level_2": 'class="data-entry"',
+    "student_a_level_3": 'class="data-entry"',
+    "student_b_level_2": "<tr><td>",
+    "student_b_level_3": "<td",
+}
+
+# Cases that list nothing by design (no filter chosen yet)
+EXPECTED_EMPTY = {"progress empty", "analysis empty"}
+
+# Time spent inside sqlite3 during the current call, in seconds
+query_time = [0.0]
+
+
+def timed(method):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            query_time[0] += time.perf_counter() - started
+    return wrapper
+
+
+class TimedCursor(sqlite3.Cursor):
+    execute = timed(sqlite3.Cursor.execute)
+    executemany = timed(sqlite3.Cursor.executemany)
+    fetchone = timed(sqlite3.Cursor.fetchone)
+    fetchmany = timed(sqlite3.Cursor.fetchmany)
+    fetchall = timed(sqlite3.Cursor.fetchall)
+    __next__ = timed(sqlite3.Cursor.__next__)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+@contextlib.contextmanager
+def sqlite_timing():
+    """Routes every sqlite3.connect() made by the pages through the timing connection class."""
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        kwargs.setdefault("factory", TimedConnection)
+        return timed(real_connect)(*args, **kwargs)
+
+    sqlite3.connect = connect
+    try:
+        yield
+    finally:
+        sqlite3.connect = real_connect
+
+
+def run_case(page, form_data, repeat):
+    """Returns median total/query/render milliseconds, peak KiB allocated and data rows shown for one case."""
+    totals, queries = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        html = page.get_page_html(form_data)  # warm-up: imports, lazy index/cube builds, OS page cache
+
+        with sqlite_timing():
+            for _ in range(repeat):
+                pyhtml.query_cache.clear()  # time the queries, not cache hits
+                query_time[0] = 0.0
+                started = time.perf_counter()
+                page.get_page_html(form_data)
+                totals.append(time.perf_counter() - started)
+                queries.append(query_time[0])
+
+        # Allocation tracking slows Python down, so it gets its own untimed call
+        pyhtml.query_cache.clear()
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        page.get_page_html(form_data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    total = statistics.median(totals)
+    query = statistics.median(queries)
+    return {
+        "total_ms": round(total * 1000, 3),
+        "query_ms": round(query * 1000, 3),
+        "render_ms": round(max(total - query, 0) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "rows": html.count(ROW_MARKERS[page.__name__]) if page.__name__ in ROW_MARKERS else None,
+    }
+
+
+def empty_cases(results):
+    """Cases that should list data but rendered no rows."""
+    return [name for name, r in results.items() if r.get("rows") == 0 and name not in EXPECTED_EMPTY]
+
+
+def find_regressions(results, baseline, tolerance, min_ms):
+    """Cases whose time or peak memory grew by more than `tolerance` (a fraction) over the baseline."""
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if now["total_ms"] > before["total_ms"] * (1 + tolerance) and now["total_ms"] - before["total_ms"] > min_ms:
+            regressions.append(f"{name}: total {before['total_ms']} ms -> {now['total_ms']} ms")
+        if now["peak_kib"] > before["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {before['peak_kib']} KiB -> {now['peak_kib']} KiB")
+    return regressions
+
+
+def run_cases(repeat, only=None):
+    """Runs every case against the immunisation.db in the working directory and prints a table."""
+    results = {}
+    print(f"{'case':<30}{'total ms':>10}{'query ms':>10}{'render ms':>11}{'peak KiB':>10}{'rows':>8}")
+    for name, module_name, form_data in CASES:
+        if only and only not in name:
+            continue
+        page = __import__(module_name)
+        try:
+            r = run_case(page, form_data, repeat)
+        except Exception as e:
+            # e.g. the Mission page on a database without the Persona table
+            print(f"{name:<30}failed: {e}")
+            continue
+        results[name] = r
+        print(f"{name:<30}{r['total_ms']:>10}{r['query_ms']:>10}{r['render_ms']:>11}{r['peak_kib']:>10}{str(r['rows'] if r['rows'] is not None else '-'):>8}")
+    return results
+
+
+def run_scaling(databases, repeat, only=None):
+    """Runs the cases once per database (e.g. make_synthetic_db.py outputs) and prints total ms side by side."""
+    import search_index
+
+    by_database = {}
+    for database in databases:
+        print(f"\n=== {database} ===")
+        with loadtest.in_workdir(database, "page-bench-"):
+            search_index.reset_index()  # the index is cached per process; rebuild it from this database
+            by_database[database] = run_cases(repeat, only)
+
+    names = [name for name, _, _ in CASES if any(name in results for results in by_database.values())]
+    labels = [os.path.basename(database) for database in databases]
+    print("\nTotal ms by database size:")
+    print(f"{'case':<30}" + "".join(f"{label[-18:]:>20}" for label in labels))
+    for name in names:
+        print(f"{name:<30}" + "".join(f"{str(by_database[d].get(name, {}).get('total_ms', '-')):>20}" for d in databases))
+    return by_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every get_page_html against a stored baseline.")
+    parser.add_argument("--db", action="append",
+                        help="database to benchmark against (default: the project's immunisation.db); "
+                             "give it several times to compare how each page scales with data size")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per case")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth, e.g. 0.25 = 25%%")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this many ms")
+    parser.add_argument("--out", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Resolve paths before changing directory
+    args.baseline = os.path.abspath(args.baseline)
+    args.out = os.path.abspath(args.out) if args.out else None
+    sys.path.insert(0, PROJECT_DIR)
+
+    if args.db and len(args.db) > 1:
+        by_database = run_scaling(args.db, args.repeat, args.only)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(by_database, f, indent=2)
+        return
+
+    # Pages open 'immunisation.db' relative to the working directory
+    if args.db:
+        with loadtest.in_workdir(args.db[0], "page-bench-"):
+            results = run_cases(args.repeat, args.only)
+    else:
+        os.chdir(PROJECT_DIR)
+        pyhtml.ensure_working_database()
+        results = run_cases(args.repeat, args.only)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    empty = empty_cases(results)
+    if empty:
+        print(f"\nNo rows shown by: {', '.join(empty)}; these cases would only time an empty page.")
+        sys.exit(1)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        # A gate with nothing to compare against must not pass
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first.")
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance, args.min_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} of the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#Logging set-up for the portal.
+#Every module logs through logging.getLogger(__name__). setup_logging() puts a queue between the
+#request threads and the output, so a request only pays for creating a record; a background thread
+#formats and writes it. Below-WARNING records can be sampled, and the queue drops (and counts)
+#records rather than ever blocking a request when the writer falls behind.
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(process)d %(levelname)-7s %(name)s: %(message)s"
+
+# Records waiting for the writer thread before new ones are dropped
+QUEUE_SIZE = 10000
+
+_listener = None
+_settings = {}
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through every WARNING and above, but only one in `rate` of the records below that."""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.counter = itertools.count()
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or next(self.counter) % self.rate == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped and counted."""
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def describe_rows(rows):
+    """What gets logged instead of a result set."""
+    return f"{len(rows)} rows"
+
+
+def setup_logging(level=logging.INFO, sample_rate=1, levels=None, stream=None):
+    """Routes all logging through a background queue.
+
+    level       -- root level, e.g. logging.DEBUG to see every query
+    sample_rate -- keep 1 in N records below WARNING (1 keeps everything)
+    levels      -- per-logger overrides, e.g. {"pyhtml": logging.WARNING}
+    stream      -- where records are written (default: stderr)
+    """
+    global _listener
+    _settings.update(level=level, sample_rate=sample_rate, levels=levels, stream=stream)
+    stop_logging()
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if sample_rate > 1:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Writes out whatever is still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if DroppingQueueHandler.dropped:
+            sys.stderr.write(f"portal_logging: dropped {DroppingQueueHandler.dropped} records (queue full)\n")
+
+
+def _restart_in_child():
+    # A forked worker inherits the queue but not the writer thread, so give it its own
+    global _listener
+    if _listener is not None:
+        _listener = None
+        setup_logging(**_settings)
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
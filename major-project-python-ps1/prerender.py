@@ -0,0 +1,138 @@
+#Offline pre-rendering of the pages whose inputs come from a short, fixed list.
+#A page module opts in by defining prerender_form_data(), which returns every form_data it can be
+#asked for. Each of those pages is rendered once, stored as HTML and gzip, and a server started with
+#--prerendered answers those requests from the stored bytes. Anything else (free-text filters,
+#unknown parameters) is still rendered on request.
+#The stored pages are tied to pyhtml.content_version(), which the ingest functions bump, so building a
+#derived table or index does not retire them. Every write path that changes data bumps it: the ingest
+#functions, DataInput.py and make_synthetic_db.py; a new one must call pyhtml.bump_content_version().
+#
+#   python demo2.py --prerender             (render into prerendered/; run again after each data load)
+#   python demo2.py 8080 --prerendered      (serve with the pre-rendered pages)
+
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+
+import pyhtml
+
+log = logging.getLogger(__name__)
+
+PRERENDER_DIR = "prerendered"
+MANIFEST_FILE = "manifest.json"
+DATABASE_FILE = 'immunisation.db'
+
+
+def filter_combinations(**choices):
+    """Every form_data a set of dropdowns can submit: each field is either left empty or set to one of its values."""
+    names = list(choices)
+    combinations = []
+    for values in itertools.product(*([None] + list(choices[name]) for name in names)):
+        combinations.append({name: [value] for name, value in zip(names, values) if value is not None})
+    return combinations
+
+
+def page_file_name(path, form_key):
+    return hashlib.sha1(repr((path, form_key)).encode("utf-8")).hexdigest()[:20]
+
+
+def prerender_site(pages, directory=PRERENDER_DIR, database=DATABASE_FILE):
+    """Renders every opted-in page of the route table into `directory`; returns how many were written.
+
+    The new set is written beside the old one and swapped in at the end, so a server reading
+    the directory never sees a half-written set.
+    """
+    staging = directory + ".new"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    entries = []
+    for path, page in sorted(pages.items()):
+        if not hasattr(page, "prerender_form_data"):
+            continue
+        for form_data in page.prerender_form_data():
+            form_key = pyhtml.normalise_form_data(form_data)
+            try:
+                html_bytes = page.get_page_html(form_data).encode("utf-8")
+            except Exception as e:
+                # Left to the dynamic renderer, which reports the error per request as usual
+                log.exception("Could not pre-render %s %s: %s", path, form_key, e)
+                continue
+            name = page_file_name(path, form_key)
+            with open(os.path.join(staging, name + ".html"), "wb") as f:
+                f.write(html_bytes)
+            with open(os.path.join(staging, name + ".html.gz"), "wb") as f:
+                f.write(gzip.compress(html_bytes, compresslevel=9, mtime=0))
+            entries.append({"path": path, "form": form_key, "file": name})
+
+    manifest = {"data_version": pyhtml.content_version(database), "pages": entries}
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    if os.path.exists(directory):
+        old = directory + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.rename(directory, old)
+        os.rename(staging, directory)
+        shutil.rmtree(old)
+    else:
+        os.rename(staging, directory)
+    return len(entries)
+
+
+class PrerenderedPages:
+    """The stored pages, held in memory as ready-to-send bytes.
+
+    lookup() only answers while the database is still at the version the pages were rendered
+    from; after a data load every request falls back to dynamic rendering until the pages are
+    rendered again, and the new set is picked up without restarting the server.
+    """
+    def __init__(self, directory=PRERENDER_DIR, database=DATABASE_FILE):
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.directory = directory
+        self.manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        self.database = database
+        self.data_version = manifest["data_version"]
+        self.stale = False
+        self.pages = {}
+        for entry in manifest["pages"]:
+            form_key = tuple((name, tuple(values)) for name, values in entry["form"])
+            base = os.path.join(directory, entry["file"])
+            with open(base + ".html", "rb") as f:
+                html_bytes = f.read()
+            with open(base + ".html.gz", "rb") as f:
+                gzip_bytes = f.read()
+            self.pages[(entry["path"], form_key)] = (html_bytes, gzip_bytes)
+
+    def lookup(self, path, form_data):
+        """Returns (html bytes, gzip bytes) for the request, or None when it has to be rendered."""
+        if pyhtml.content_version(self.database) != self.data_version:
+            try:
+                rerendered = os.stat(os.path.join(self.directory, MANIFEST_FILE)).st_mtime_ns != self.manifest_mtime
+            except FileNotFoundError:
+                rerendered = False  # in the middle of being swapped
+            if rerendered:
+                self.__init__(self.directory, self.database)
+                log.info("Reloaded %d pre-rendered pages from %s", len(self.pages), self.directory)
+                return self.lookup(path, form_data)
+            if not self.stale:
+                log.warning("The database has changed since the pages were pre-rendered; rendering on request instead")
+                self.stale = True
+            return None
+        return self.pages.get((path, pyhtml.normalise_form_data(form_data)))
+
+
+def load_prerendered(directory=PRERENDER_DIR, database=DATABASE_FILE):
+    """The stored pages, or None (with a warning) if nothing has been pre-rendered yet."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        log.warning("No pre-rendered pages in %s; run 'python demo2.py --prerender' first", directory)
+        return None
+    pages = PrerenderedPages(directory, database)
+    log.info("Loaded %d pre-rendered pages from %s", len(pages.pages), directory)
+    return pages
@@ -2,65 +2,497 @@
 #File version: 2025.03.28
 #Author: Gayan Wijesinghe, for questions, contact via Ms Teams.
 
+import logging
 import sqlite3
 import os
+import re
+import shutil
+import sys
+import signal
+import threading
+import time
+from collections import OrderedDict
 
 import http.server
 import socketserver
 from urllib.parse import parse_qs, urlparse
 
+import portal_logging
+import static_assets
+
 need_debugging_help=True
 
+log = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one computation.
+
+    The first caller for a key runs the function; anyone arriving with that key while
+    it is still running waits for it and gets the same result (or exception).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if leader:
+            try:
+                call["result"] = function()
+            except Exception as e:
+                call["error"] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call["done"].set()
+        else:
+            debugging_helper(f"\tJoining an identical request already being rendered: {key}")
+            call["done"].wait()
+
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+
+in_flight_renders = SingleFlight()
+
+
+class QueryCache:
+    """LRU cache of query results, bounded by the approximate memory their rows take up.
+
+    Each entry remembers the data version it was read at, and is thrown away once the
+    database has changed since. Results bigger than max_entry_bytes are never stored, so one
+    large table cannot push out every small lookup.
+    """
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (version, rows, size)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.bytes -= self.entries.pop(key)[2]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, rows):
+        size = rows_size(rows)
+        if size > self.max_entry_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[2]
+            self.entries[key] = (version, tuple(rows), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self.entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+def rows_size(rows):
+    """Approximate bytes held by a result set (the list, its row tuples and their values)."""
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in rows)
+
+
+def data_version(database):
+    """Changes whenever the database file is written to.
+
+    PRAGMA data_version only reports changes seen by one open connection, and every query here
+    opens a new one, so the file's size and modification time (and its WAL file's, in WAL mode)
+    are used instead.
+    """
+    stat = os.stat(database)
+    version = (stat.st_mtime_ns, stat.st_size)
+    try:
+        wal = os.stat(database + "-wal")
+        version += (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        pass
+    return version
+
+
+# Counter of data loads, kept in the database itself. Unlike data_version() it does not move when a
+# derived table or index is built, only when data is loaded (functions that load data call
+# bump_content_version() in the same transaction).
+CONTENT_VERSION_TABLE = "DataVersion"
+
+# database -> (data_version() when last read, content version)
+_content_versions = {}
+_content_versions_lock = threading.Lock()
+
+
+def bump_content_version(conn):
+    """Records a data load; call it before committing the load."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {CONTENT_VERSION_TABLE} (version INTEGER NOT NULL)")
+    if conn.execute(f"UPDATE {CONTENT_VERSION_TABLE} SET version = version + 1").rowcount == 0:
+        conn.execute(f"INSERT INTO {CONTENT_VERSION_TABLE} (version) VALUES (1)")
+
+
+def content_version(database):
+    """How many loads the database's data has had (0 before the first). Only re-read after the file changes."""
+    path = os.path.abspath(database)
+    file_version = data_version(database)
+    with _content_versions_lock:
+        cached = _content_versions.get(path)
+    if cached is not None and cached[0] == file_version:
+        return cached[1]
+    connection = sqlite3.connect(database)
+    try:
+        row = connection.execute(f"SELECT version FROM {CONTENT_VERSION_TABLE}").fetchone()
+    except sqlite3.OperationalError:
+        row = None  # nothing has been loaded through the ingest functions yet
+    finally:
+        connection.close()
+    version = row[0] if row else 0
+    with _content_versions_lock:
+        _content_versions[path] = (file_version, version)
+    return version
+
+
+# The database as shipped, tracked in git. The pages read (and the startup builds write their derived
+# tables into) a working copy made from it, immunisation.db, which git ignores; delete that copy to start
+# again from the shipped data.
+SOURCE_DATABASE = os.path.join("database", "immunisation.db")
+
+
+def ensure_working_database(database="immunisation.db", source=SOURCE_DATABASE):
+    """Copies the shipped database to `database` unless there is a copy already. (A 0-byte file, left by a
+    connect() to a database that was not there, counts as none.)"""
+    if os.path.exists(database) and os.path.getsize(database) > 0:
+        return False
+    shutil.copyfile(source, database)
+    log.info("Copied %s to %s", source, database)
+    return True
+
+
+# (database, data version, function) combinations prepare_database() has already run
+_prepared = set()
+_prepared_lock = threading.Lock()
+# database -> lock held while one of its prepare functions runs
+_prepare_locks = {}
+
+# Seconds another server process waits for a build in progress before giving up
+PREPARE_TIMEOUT = 600
+
+
+def prepare_database(database, prepare):
+    """Runs prepare(connection), an ensure_* function that creates derived tables or indexes,
+    unless it has already run against this version of the database.
+
+    Builds of one database run one at a time, each in a single write transaction: a request that
+    arrives during a build waits for it and then finds the table complete, never created but empty.
+    BEGIN IMMEDIATE makes the other worker processes wait in the same way.
+    """
+    path = os.path.abspath(database)
+    with _prepared_lock:
+        if (path, data_version(database), prepare) in _prepared:
+            return
+        database_lock = _prepare_locks.setdefault(path, threading.Lock())
+    with database_lock:
+        with _prepared_lock:
+            if (path, data_version(database), prepare) in _prepared:
+                return  # built by the request we waited for
+        connection = sqlite3.connect(database, timeout=PREPARE_TIMEOUT)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            prepare(connection)
+            connection.commit()
+        finally:
+            connection.close()
+        with _prepared_lock:
+            _prepared.add((path, data_version(database), prepare))
+
+
+def normalise_sql(query):
+    """Collapses whitespace outside string literals, so differently indented copies of a query share a cache entry."""
+    return re.sub(r"('(?:[^']|'')*')|\s+", lambda match: match.group(1) or " ", query).strip()
+
+
+# Memory the cached query results may take up in each process
+QUERY_CACHE_BYTES = 32 * 1024 * 1024
+
+# Results bigger than this are always read from the database
+QUERY_CACHE_MAX_ENTRY_BYTES = 1024 * 1024
+
+query_cache = QueryCache(QUERY_CACHE_BYTES, QUERY_CACHE_MAX_ENTRY_BYTES)
+
+
+def normalise_form_data(form_data):
+    """A hashable form of the query: parameter order and empty values make no difference to the pages."""
+    return tuple(sorted((name, tuple(values)) for name, values in form_data.items() if any(values)))
+
+
 class MyRequestHandler(http.server.SimpleHTTPRequestHandler):
     pages={}
+    prerendered=None  # set to prerender.PrerenderedPages to answer finite-parameter pages from stored bytes
+
+    def log_message(self, format, *args):
+        # Access log lines go through the logging queue instead of being written to stderr here
+        log.info("%s - %s", self.address_string(), format % args)
+
     def do_GET(self):
+        self.send_page_or_file()
+
+    def do_HEAD(self):
+        # The same routes as GET, without the body
+        self.send_page_or_file(head_only=True)
+
+    def send_page_or_file(self, head_only=False):
         parsed_url = urlparse(self.path)
-        debugging_helper(f"A web browser wants to GET the following: {parsed_url.path}")
-        if parsed_url.path in MyRequestHandler.pages:
+        debugging_helper(f"A web browser wants to {self.command} the following: {parsed_url.path}")
+        if parsed_url.path in MyRequestHandler.pages and hasattr(MyRequestHandler.pages[parsed_url.path], "page_response"):
+            # Pages that produce something other than HTML (e.g. CSV downloads) give their own headers and body
+            form_data = parse_qs(parsed_url.query)
+            debugging_helper(f"\tReceived following data with {self.command} request: {form_data}")
+            send_page_chunks(self, *MyRequestHandler.pages[parsed_url.path].page_response(form_data), head_only=head_only)
+        elif parsed_url.path in MyRequestHandler.pages:
+            query = parsed_url.query
+            form_data = parse_qs(query)
+            debugging_helper(f"\tReceived following data with {self.command} request: {form_data}")
+
+            if MyRequestHandler.prerendered is not None:
+                stored = MyRequestHandler.prerendered.lookup(parsed_url.path, form_data)
+                if stored is not None:
+                    self.send_prerendered(*stored, head_only=head_only)
+                    return
+
+            # Identical concurrent requests share one render instead of each computing the same page
+            page = MyRequestHandler.pages[parsed_url.path]
+            key = (parsed_url.path, normalise_form_data(form_data))
+            try:
+                html_bytes = in_flight_renders.do(key, lambda: page.get_page_html(form_data).encode('utf-8'))
+            except Exception as e:
+                log.exception("Error rendering %s: %s", parsed_url.path, e)
+                self.send_error(500)
+                return
+
             self.send_response(200)
             self.send_header("Content-type", "text/html")
+            self.send_header("Content-Length", str(len(html_bytes)))
             self.end_headers()
-
-            query = parsed_url.query
-            form_data = parse_qs(query)
-            debugging_helper(f"\tReceived following data with GET request: {form_data}")
-            
-            html_content = MyRequestHandler.pages[parsed_url.path].get_page_html(form_data)
-            
-            self.wfile.write(html_content.encode('utf-8'))            
+            if not head_only:
+                self.wfile.write(html_bytes)
         else:
-            # Let the server handle static files (like images, .html files)
-            super().do_GET()
+            # Static files (css, js, images) come from memory or sendfile(), with caching headers and ranges
+            static_assets.send_static(self, parsed_url.path, head_only=head_only)
+
+    def send_prerendered(self, html_bytes, gzip_bytes, head_only=False):
+        """Sends a pre-rendered page, compressed when the browser accepts gzip."""
+        compressed = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = gzip_bytes if compressed else html_bytes
+        self.send_response(200)
+        self.send_header("Content-type", "text/html")
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
             
 
-def host_site():
-    # Set the port
-    PORT = 80
+def send_page_chunks(handler, status, headers, chunks, head_only=False):
+    """Writes a page's page_response() -- (status, [(header, value)], body chunks) -- through a request handler."""
+    handler.send_response(status)
+    for name, value in headers:
+        handler.send_header(name, value)
+    handler.end_headers()
+    if head_only:
+        if hasattr(chunks, "close"):
+            chunks.close()  # never started, so no query has run
+        return
+    for chunk in chunks:
+        handler.wfile.write(chunk)
+
+
+def print_site_address(PORT):
+    print("Using your favourite browser, go to:\n")
+    if (PORT==80):
+        print("http://localhost")
+    print(f"or\nhttp://localhost:{PORT}\n")
 
-    # Create the HTTP server
-    with socketserver.TCPServer(("", PORT), MyRequestHandler) as httpd:
-        print("Using your favourite browser, go to:\n")
-        if (PORT==80):
-            print("http://localhost")
-        print(f"or\nhttp://localhost:{PORT}\n")
+
+def host_site(PORT=80, workers=1):
+    # PORT defaults to 80; demo2.py takes another one from the command line (e.g. for load tests)
+    # workers > 1 starts that many worker processes sharing the port (Linux/macOS only)
+    if workers > 1 and hasattr(os, "fork"):
+        host_site_prefork(PORT, workers)
+        return
+
+    # Create the HTTP server (one thread per request, so a slow page does not hold up the others)
+    with socketserver.ThreadingTCPServer(("", PORT), MyRequestHandler) as httpd:
+        httpd.daemon_threads = True
+        print_site_address(PORT)
+        httpd.serve_forever()
+
+
+def serve_worker(httpd):
+    """Body of a pre-forked worker: serve until SIGTERM, finish the requests in progress, then exit."""
+    global in_flight_renders, query_cache
+    # Nothing is rendered in the supervisor, so every worker starts with its own empty caches
+    # and opens its own database connections.
+    in_flight_renders = SingleFlight()
+    query_cache = QueryCache(QUERY_CACHE_BYTES, QUERY_CACHE_MAX_ENTRY_BYTES)
+    httpd.daemon_threads = False  # server_close() then waits for in-flight requests
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown).start())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the supervisor
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    exit_code = 0
+    try:
         httpd.serve_forever()
-        
-        
-def get_results_from_query(database,query):
-    debugging_helper("\n------------------------")
-    debugging_helper("Opening database \""+database+"\"... ")
+    except Exception as e:
+        log.exception("Worker %d crashed: %s", os.getpid(), e)
+        exit_code = 1
+    finally:
+        httpd.server_close()
+        portal_logging.stop_logging()  # os._exit skips atexit, so flush the log queue first
+        os._exit(exit_code)
+
+
+def host_site_prefork(PORT, workers):
+    """Supervisor: binds the port once, forks the workers, restarts any that die.
+
+    SIGHUP reloads: a fresh set of workers is started and the old ones are drained.
+    SIGTERM or Ctrl+C drains all workers and stops.
+    """
+    httpd = socketserver.ThreadingTCPServer(("", PORT), MyRequestHandler, bind_and_activate=False)
+    httpd.allow_reuse_address = True
+    httpd.server_bind()
+    httpd.server_activate()
+    print_site_address(PORT)
+
+    current = {}  # pid -> start time, for workers that should be running
+    retiring = set()  # pids told to drain and exit
+    requested = {"reload": False, "stop": False}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            serve_worker(httpd)
+        current[pid] = time.time()
+
+    for _ in range(workers):
+        spawn()
+    log.info("Started %d worker processes: %s", workers, sorted(current))
+
+    signal.signal(signal.SIGHUP, lambda signum, frame: requested.update(reload=True))
+    signal.signal(signal.SIGTERM, lambda signum, frame: requested.update(stop=True))
+    signal.signal(signal.SIGINT, lambda signum, frame: requested.update(stop=True))
+
+    while not requested["stop"]:
+        if requested["reload"]:
+            requested["reload"] = False
+            old = list(current)
+            current.clear()
+            for _ in range(workers):
+                spawn()
+            for pid in old:
+                os.kill(pid, signal.SIGTERM)
+            retiring.update(old)
+            log.info("Reloaded: draining %s, new workers %s", old, sorted(current))
+
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        if pid in retiring:
+            retiring.discard(pid)
+        elif pid in current:
+            started = current.pop(pid)
+            log.warning("Worker %d exited unexpectedly (status %d); restarting it", pid, status)
+            if time.time() - started < 1:
+                time.sleep(1)  # don't spin if workers die straight after starting
+            spawn()
+
+    # Shut down: drain every worker, then release the port
+    for pid in list(current) + list(retiring):
+        os.kill(pid, signal.SIGTERM)
+    for pid in list(current) + list(retiring):
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    httpd.server_close()
+    log.info("All workers stopped.")
+
+
+def get_results_from_query(database,query,params=()):
+    # Repeated queries (dropdown lists, global rates, ID lookups) are answered from query_cache
+    # until the database changes
+    key = (os.path.abspath(database), normalise_sql(query), tuple(params))
+    version = data_version(database)
+    cached = query_cache.get(key, version)
+    if cached is not None:
+        if need_debugging_help:
+            log.debug("Query cache hit on \"%s\": %s", database, key[1])
+        return list(cached)
+
     connection = sqlite3.connect(database)
-    cursor=connection.cursor()
-    debugging_helper("done\n")
-    debugging_helper("Executing query \""+query+"\"... ")
-    cursor.execute(query)
-    debugging_helper("done\n")
-    debugging_helper("Fetching results...\n")
-    results = cursor.fetchall();
-    debugging_helper(results)
-    debugging_helper("\n------------------------")
+    try:
+        cursor=connection.cursor()
+        if need_debugging_help:
+            log.debug("Executing query on \"%s\": %s", database, query)
+        cursor.execute(query, params)
+        results = cursor.fetchall();
+    finally:
+        connection.close()
+    if need_debugging_help:
+        # Only the size of the result set is logged, never the rows themselves
+        log.debug("Fetched %s", portal_logging.describe_rows(results))
+    query_cache.put(key, version, results)
     return results
 
+# Rows fetched from SQLite at a time by the iterator functions below. This bounds the rows held by the
+# database side of a request only: the HTML pages still build their whole body (one string) from the
+# rows, so their memory grows with the result. Only page_response() downloads (export_data) stay flat.
+FETCH_BATCH_SIZE = 500
+
+def iter_result_batches(database, query, params=(), batch_size=None):
+    """Yields the query's rows as lists of up to batch_size rows (cursor.fetchmany), closing the connection at the end."""
+    batch_size = batch_size or FETCH_BATCH_SIZE
+    # The async server resumes a streamed response on whichever pool thread is free, one step at a time
+    connection = sqlite3.connect(database, check_same_thread=False)
+    try:
+        cursor=connection.cursor()
+        if need_debugging_help:
+            log.debug("Executing query on \"%s\" (batches of %d): %s", database, batch_size, query)
+        cursor.execute(query, params)
+        fetched = 0
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            fetched += len(batch)
+            yield batch
+        if need_debugging_help:
+            log.debug("Fetched %d rows", fetched)
+    finally:
+        connection.close()
+
+def iter_results_from_query(database, query, params=(), batch_size=None):
+    """Like get_results_from_query, but yields one row at a time instead of building the whole list."""
+    for batch in iter_result_batches(database, query, params, batch_size):
+        yield from batch
+
 def debugging_helper(message):
     if (need_debugging_help):
-        print(message,)
+        log.debug("%s", message)
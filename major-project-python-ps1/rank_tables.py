@@ -0,0 +1,147 @@
+import sqlite3
+
+import region_rollup
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Precomputed rank and percentile of every country per (category, year), so "top N",
+# "bottom N", "percentile band" and "where does this country rank" are index range scans
+# instead of sorting every country on each request.
+RANK_TABLE = "RateRank"
+
+# measure -> (source query, category column, year column). Each source yields
+# category, country, year and rate; {filter} narrows it to one partition.
+#   infection_rate: cases per 100,000 per (inf_type, year), from the country rows of region_rollup
+#   coverage:       reported coverage % per (antigen, year), averaged over the antigen's rows
+# Rank 1 is the highest rate, so the worst infection rate and the best coverage.
+SOURCES = {
+    "infection_rate": (f"""
+        SELECT category, node AS country, year, ROUND(total * 100000.0 / base, 2) AS rate
+        FROM {region_rollup.ROLLUP_TABLE}
+        WHERE measure = 'cases' AND level = 'country' AND total IS NOT NULL AND base > 0 {{filter}}
+    """, "category", "year"),
+    "coverage": ("""
+        SELECT antigen AS category, country, year, ROUND(AVG(NULLIF(coverage, '')), 2) AS rate
+        FROM Vaccination
+        WHERE NULLIF(coverage, '') IS NOT NULL {filter}
+        GROUP BY antigen, country, year
+    """, "antigen", "year"),
+}
+
+
+def create_rank_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RANK_TABLE} (
+            measure    TEXT     NOT NULL,
+            category   TEXT     NOT NULL,
+            year       INTEGER  NOT NULL,
+            country    TEXT     NOT NULL,
+            rate       REAL     NOT NULL,
+            rank       INTEGER  NOT NULL,
+            percentile REAL     NOT NULL,
+            ranked     INTEGER  NOT NULL,
+            PRIMARY KEY (measure, category, year, country)
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {RANK_TABLE}_rank ON {RANK_TABLE} (measure, category, year, rank)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {RANK_TABLE}_percentile ON {RANK_TABLE} (measure, category, year, percentile)")
+
+
+def insert_ranks(conn, measure, filter="", params=()):
+    """Ranks the source rows within each (category, year). percentile is the % of countries with a lower rate."""
+    conn.execute(f"""
+        INSERT INTO {RANK_TABLE} (measure, category, year, country, rate, rank, percentile, ranked)
+        SELECT ?, category, year, country, rate,
+               RANK() OVER (PARTITION BY category, year ORDER BY rate DESC),
+               ROUND(100 * PERCENT_RANK() OVER (PARTITION BY category, year ORDER BY rate), 2),
+               COUNT(*) OVER (PARTITION BY category, year)
+        FROM ({SOURCES[measure][0].format(filter=filter)})
+    """, [measure, *params])
+
+
+def build_ranks(conn):
+    """Rebuilds every measure's ranks (and the rollup they are read from, if missing)."""
+    region_rollup.ensure_rollup(conn)
+    create_rank_table(conn)
+    conn.execute(f"DELETE FROM {RANK_TABLE}")
+    for measure in SOURCES:
+        insert_ranks(conn, measure)
+    conn.commit()
+
+
+def ensure_ranks(conn):
+    """Builds the rank table the first time it is needed."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (RANK_TABLE,)
+    ).fetchone()
+    if not exists:
+        build_ranks(conn)
+
+
+def refresh_partitions(conn, measure, partitions):
+    """Re-ranks only the given (category, year) partitions, e.g. after new facts for them were loaded."""
+    create_rank_table(conn)
+    _, category_column, year_column = SOURCES[measure]
+    for category, year in set(partitions):
+        conn.execute(f"DELETE FROM {RANK_TABLE} WHERE measure = ? AND category = ? AND year = ?", (measure, category, year))
+        insert_ranks(conn, measure, f"AND {category_column} = ? AND {year_column} = ?", (category, year))
+
+
+def query_ranks(measure, category, year, where="", params=(), order="r.rank", limit=None, database=DATABASE_FILE):
+    """Rows (country, name, rate, rank, percentile, ranked) of one partition, read through the indexes."""
+    if measure not in SOURCES:
+        raise ValueError(f"Unknown measure '{measure}'. Use one of: {', '.join(SOURCES)}")
+    query = f"""
+        SELECT r.country, c.name, r.rate, r.rank, r.percentile, r.ranked
+        FROM {RANK_TABLE} r
+        LEFT JOIN Country c ON c.CountryID = r.country
+        WHERE r.measure = ? AND r.category = ? AND r.year = ? {where}
+        ORDER BY {order}
+        {'LIMIT ?' if limit is not None else ''};
+    """
+    all_params = [measure, category, int(year), *params] + ([int(limit)] if limit is not None else [])
+
+    conn = sqlite3.connect(database)
+    try:
+        ensure_ranks(conn)
+        return conn.execute(query, all_params).fetchall()
+    finally:
+        conn.close()
+
+
+def top_n(measure, category, year, n=10, database=DATABASE_FILE):
+    """The n highest rates (rank 1 first)."""
+    return query_ranks(measure, category, year, order="r.rank", limit=n, database=database)
+
+
+def bottom_n(measure, category, year, n=10, database=DATABASE_FILE):
+    """The n lowest rates (lowest first)."""
+    return query_ranks(measure, category, year, order="r.rank DESC", limit=n, database=database)
+
+
+def percentile_band(measure, category, year, low, high, database=DATABASE_FILE):
+    """Countries whose percentile lies between low and high (0-100), highest rate first."""
+    return query_ranks(measure, category, year, "AND r.percentile BETWEEN ? AND ?", (low, high),
+                       order="r.percentile DESC", database=database)
+
+
+def country_rank(measure, category, year, country, database=DATABASE_FILE):
+    """One country's (country, name, rate, rank, percentile, ranked) row, or None if it is not ranked."""
+    rows = query_ranks(measure, category, year, "AND r.country = ?", (country,), database=database)
+    return rows[0] if rows else None
+
+
+def ranks_by_name(measure, category, year, database=DATABASE_FILE):
+    """Country name -> (rank, percentile, ranked) for a whole partition, for pages that list countries by name."""
+    return {name: (rank, percentile, ranked)
+            for _, name, _, rank, percentile, ranked in query_ranks(measure, category, year, database=database)}
+
+
+if __name__ == "__main__":
+    # Rebuild after a bulk load that bypassed the ingest functions
+    connection = sqlite3.connect(DATABASE_FILE)
+    build_ranks(connection)
+    count = connection.execute(f"SELECT COUNT(*) FROM {RANK_TABLE}").fetchone()[0]
+    connection.close()
+    print(f"Rebuilt {RANK_TABLE} with {count} rows.")
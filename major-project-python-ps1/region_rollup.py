@@ -0,0 +1,262 @@
+import sqlite3
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Country -> region -> global rollups of the fact tables, one row per node and year.
+# Region and global rows are sums of the country rows, so comparing a country with its
+# region (or a region with the world) is a lookup instead of a multi-join aggregate.
+ROLLUP_TABLE = "RegionRollup"
+
+GLOBAL_NODE = "WORLD"
+
+LEVELS = ["country", "region", "global"]
+
+# measure -> (rate scale, country-level query). Each query yields
+# (category, country, region, year, total, base, country_count); {where} narrows the fact rows.
+#   cases:      total = cases, base = population of the countries reporting cases (rate per 100,000)
+#   doses:      total = doses, base = target population (coverage %), category = antigen
+#   population: total = population, no base or category
+MEASURES = {
+    "cases": (100000, """
+        SELECT i.inf_type, i.country, c.region, i.year, SUM(i.cases),
+               SUM(CASE WHEN i.cases IS NOT NULL THEN cp.population END), COUNT(i.cases)
+        FROM InfectionData i
+        JOIN Country c ON i.country = c.CountryID
+        LEFT JOIN CountryPopulation cp ON cp.country = i.country AND cp.year = i.year
+        {where}
+        GROUP BY i.inf_type, i.country, i.year
+    """),
+    "doses": (100, """
+        SELECT v.antigen, v.country, c.region, v.year, SUM(NULLIF(v.doses, '')),
+               SUM(CASE WHEN NULLIF(v.doses, '') IS NOT NULL THEN NULLIF(v.target_num, '') END),
+               COUNT(NULLIF(v.doses, ''))
+        FROM Vaccination v
+        JOIN Country c ON v.country = c.CountryID
+        {where}
+        GROUP BY v.antigen, v.country, v.year
+    """),
+    "population": (None, """
+        SELECT '', cp.country, c.region, cp.year, SUM(cp.population), NULL, COUNT(cp.population)
+        FROM CountryPopulation cp
+        JOIN Country c ON cp.country = c.CountryID
+        {where}
+        GROUP BY cp.country, cp.year
+    """),
+}
+
+# measure -> (category column, country column, year column) in its country-level query
+FACT_COLUMNS = {
+    "cases": ("i.inf_type", "i.country", "i.year"),
+    "doses": ("v.antigen", "v.country", "v.year"),
+    "population": ("''", "cp.country", "cp.year"),
+}
+
+COLUMNS = "measure, level, category, node, parent, year, total, base, country_count"
+
+
+def create_rollup_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+            measure       TEXT     NOT NULL,
+            level         TEXT     NOT NULL,
+            category      TEXT     NOT NULL,
+            node          TEXT     NOT NULL,
+            parent        TEXT,
+            year          INTEGER  NOT NULL,
+            total         REAL,
+            base          REAL,
+            country_count INTEGER  NOT NULL,
+            PRIMARY KEY (measure, level, category, node, year)
+        )
+    """)
+    # Children of a node: a region's countries, the world's regions
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_parent ON {ROLLUP_TABLE} (measure, category, parent, year)")
+
+
+def insert_country_rows(conn, measure, where="", params=()):
+    query = MEASURES[measure][1].format(where=where)
+    conn.execute(f"INSERT INTO {ROLLUP_TABLE} ({COLUMNS}) SELECT ?, 'country', * FROM ({query})", [measure, *params])
+
+
+def insert_parent_rows(conn, where="", params=()):
+    """Sums country rows into region rows and global rows. {where} narrows the country rows summed."""
+    conn.execute(f"""
+        INSERT INTO {ROLLUP_TABLE} ({COLUMNS})
+        SELECT measure, 'region', category, parent, '{GLOBAL_NODE}', year, SUM(total), SUM(base), SUM(country_count)
+        FROM {ROLLUP_TABLE}
+        WHERE level = 'country' AND parent IS NOT NULL {where}
+        GROUP BY measure, category, parent, year
+    """, params)
+    conn.execute(f"""
+        INSERT INTO {ROLLUP_TABLE} ({COLUMNS})
+        SELECT measure, 'global', category, '{GLOBAL_NODE}', NULL, year, SUM(total), SUM(base), SUM(country_count)
+        FROM {ROLLUP_TABLE}
+        WHERE level = 'country' {where}
+        GROUP BY measure, category, year
+    """, params)
+
+
+def build_rollup(conn):
+    """Rebuilds every level of every measure from the fact tables."""
+    create_rollup_table(conn)
+    conn.execute(f"DELETE FROM {ROLLUP_TABLE}")
+    for measure in MEASURES:
+        insert_country_rows(conn, measure)
+    insert_parent_rows(conn)
+    conn.commit()
+
+
+def ensure_rollup(conn):
+    """Builds the rollup the first time it is needed."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ROLLUP_TABLE,)
+    ).fetchone()
+    if not exists:
+        build_rollup(conn)
+
+
+def refresh_nodes(conn, measure, fact_keys):
+    """Recomputes the rows touched by the given (category, country, year) fact rows at every level."""
+    create_rollup_table(conn)
+    category_column, country_column, year_column = FACT_COLUMNS[measure]
+    touched = set()
+    for category, country, year in fact_keys:
+        if measure == "population":
+            category = ""
+        conn.execute(
+            f"DELETE FROM {ROLLUP_TABLE} WHERE measure = ? AND level = 'country' AND category = ? AND node = ? AND year = ?",
+            (measure, category, country, year),
+        )
+        insert_country_rows(conn, measure, f"WHERE {category_column} = ? AND {country_column} = ? AND {year_column} = ?",
+                            (category, country, year))
+        touched.add((category, year))
+
+    # A changed country moves its region's and the world's totals for that year
+    for category, year in touched:
+        conn.execute(
+            f"DELETE FROM {ROLLUP_TABLE} WHERE measure = ? AND level != 'country' AND category = ? AND year = ?",
+            (measure, category, year),
+        )
+        insert_parent_rows(conn, "AND measure = ? AND category = ? AND year = ?", (measure, category, year))
+
+
+def rate(measure, total, base):
+    scale = MEASURES[measure][0]
+    if scale is None or total is None or not base:
+        return None
+    return round(total * scale / base, 2)
+
+
+def query_level(measure, level, category=None, year=None, node=None, parent=None, database=DATABASE_FILE):
+    """Rows of one level of the hierarchy, optionally narrowed to a category, year, node or parent.
+
+    Each returned row is (node, name, parent, category, year, total, base, rate, country_count),
+    where rate is cases per 100,000 for "cases", coverage % for "doses" and None for "population".
+    """
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure '{measure}'. Use one of: {', '.join(MEASURES)}")
+    if level not in LEVELS:
+        raise ValueError(f"Unknown level '{level}'. Use one of: {', '.join(LEVELS)}")
+
+    filters = ["ru.measure = ?", "ru.level = ?"]
+    params = [measure, level]
+    for column, value in (("category", category), ("node", node), ("parent", parent)):
+        if value is not None:
+            filters.append(f"ru.{column} = ?")
+            params.append(value)
+    if year is not None and str(year).isdigit():
+        filters.append("ru.year = ?")
+        params.append(int(year))
+
+    query = f"""
+        SELECT ru.node, COALESCE(c.name, r.region, 'World'), ru.parent, ru.category, ru.year,
+               ru.total, ru.base, ru.country_count
+        FROM {ROLLUP_TABLE} ru
+        LEFT JOIN Country c ON ru.level = 'country' AND c.CountryID = ru.node
+        LEFT JOIN Region r ON ru.level = 'region' AND r.RegionID = ru.node
+        WHERE {' AND '.join(filters)}
+        ORDER BY ru.category, ru.year, ru.node;
+    """
+
+    conn = sqlite3.connect(database)
+    try:
+        ensure_rollup(conn)
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    return [(node_id, name, parent_id, cat, yr, total, base, rate(measure, total, base), count)
+            for node_id, name, parent_id, cat, yr, total, base, count in rows]
+
+
+def children(measure, level, node, category=None, year=None, database=DATABASE_FILE):
+    """The rows one level below a node: a region's countries or the world's regions."""
+    child_level = LEVELS[LEVELS.index(level) - 1] if level != "country" else None
+    if child_level is None:
+        return []
+    return query_level(measure, child_level, category=category, year=year, parent=node, database=database)
+
+
+def compare_with_parent(measure, level, node, category=None, year=None, database=DATABASE_FILE):
+    """Sets a node beside its parent, year by year, in one self-join of the rollup table.
+
+    Returns a list of dicts with the node's and parent's totals and rates, the node's share
+    of the parent total (%) and the difference between the two rates.
+    """
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure '{measure}'. Use one of: {', '.join(MEASURES)}")
+    if level not in LEVELS[:-1]:
+        raise ValueError(f"Only {' and '.join(LEVELS[:-1])} nodes have a parent to compare with.")
+
+    filters = ["n.measure = ?", "n.level = ?", "n.node = ?"]
+    params = [LEVELS[LEVELS.index(level) + 1], measure, level, node]
+    if category is not None:
+        filters.append("n.category = ?")
+        params.append(category)
+    if year is not None and str(year).isdigit():
+        filters.append("n.year = ?")
+        params.append(int(year))
+
+    query = f"""
+        SELECT n.node, COALESCE(c.name, nr.region), n.parent, COALESCE(pr.region, 'World'), n.category, n.year,
+               n.total, n.base, p.total, p.base
+        FROM {ROLLUP_TABLE} n
+        JOIN {ROLLUP_TABLE} p
+            ON p.measure = n.measure AND p.level = ? AND p.category = n.category
+           AND p.node = n.parent AND p.year = n.year
+        LEFT JOIN Country c ON n.level = 'country' AND c.CountryID = n.node
+        LEFT JOIN Region nr ON n.level = 'region' AND nr.RegionID = n.node
+        LEFT JOIN Region pr ON p.level = 'region' AND pr.RegionID = p.node
+        WHERE {' AND '.join(filters)}
+        ORDER BY n.category, n.year;
+    """
+
+    conn = sqlite3.connect(database)
+    try:
+        ensure_rollup(conn)
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+    comparisons = []
+    for node_id, name, parent_id, parent_name, cat, yr, total, base, parent_total, parent_base in rows:
+        node_rate = rate(measure, total, base)
+        parent_rate = rate(measure, parent_total, parent_base)
+        comparisons.append({
+            "node": node_id, "name": name, "parent": parent_id, "parent_name": parent_name,
+            "category": cat, "year": yr,
+            "total": total, "parent_total": parent_total,
+            "share": round(total * 100 / parent_total, 2) if total is not None and parent_total else None,
+            "rate": node_rate, "parent_rate": parent_rate,
+            "rate_difference": round(node_rate - parent_rate, 2) if node_rate is not None and parent_rate is not None else None,
+        })
+    return comparisons
+
+
+if __name__ == "__main__":
+    # Rebuild after a bulk load that bypassed the ingest functions
+    connection = sqlite3.connect(DATABASE_FILE)
+    build_rollup(connection)
+    count = connection.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}").fetchone()[0]
+    connection.close()
+    print(f"Rebuilt {ROLLUP_TABLE} with {count} rows.")
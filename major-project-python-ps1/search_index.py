@@ -0,0 +1,148 @@
+import sqlite3
+from urllib.parse import urlencode
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# How many suggestions are precomputed for every prefix
+MAX_SUGGESTIONS = 8
+
+# Lower weight = listed first when two entries match equally well
+KIND_WEIGHT = {"Country": 0, "Infection": 1, "Region": 2, "Antigen": 3}
+
+# Built on the first search and kept for the life of the server process
+_index = None
+
+
+def normalise(text):
+    return " ".join(text.lower().split())
+
+
+def words(text):
+    return text.replace(",", " ").replace("-", " ").split()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """In-memory prefix and trigram index over the dimension names shown on the portal.
+
+    Every entry is (label, kind, url). Word prefixes map straight to a ranked list of
+    entries, so a one-word suggestion is a single dictionary lookup. Trigrams catch
+    matches in the middle of a word (e.g. "stral" -> Australia).
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.keys = [normalise(label) for label, _, _ in entries]
+        self.prefixes = {}
+        self.grams = {}
+        for entry_id, key in enumerate(self.keys):
+            for word in words(key):
+                for end in range(1, len(word) + 1):
+                    self.prefixes.setdefault(word[:end], set()).add(entry_id)
+            for gram in trigrams(key):
+                self.grams.setdefault(gram, set()).add(entry_id)
+
+        # Rank every prefix's matches once, up front
+        self.suggestions = {
+            prefix: self.rank(prefix, ids)[:MAX_SUGGESTIONS]
+            for prefix, ids in self.prefixes.items()
+        }
+
+    def score(self, query, entry_id):
+        key = self.keys[entry_id]
+        label, kind, _ = self.entries[entry_id]
+        if key == query:
+            match = 0
+        elif key.startswith(query):
+            match = 1
+        elif (" " + key).find(" " + query) >= 0:
+            match = 2
+        else:
+            match = 3
+        return (match, KIND_WEIGHT.get(kind, 9), len(key), label)
+
+    def rank(self, query, ids):
+        return [self.entries[entry_id] for entry_id in sorted(ids, key=lambda entry_id: self.score(query, entry_id))]
+
+    def candidates(self, query):
+        """Ids of entries containing every word of the query as a word prefix or substring."""
+        result = None
+        for word in words(query):
+            ids = self.prefixes.get(word)
+            if ids is None:
+                ids = self.substring_ids(word)
+            result = set(ids) if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def substring_ids(self, word):
+        if len(word) < 3:
+            return set()
+        ids = None
+        for gram in trigrams(word):
+            posting = self.grams.get(gram, set())
+            ids = set(posting) if ids is None else ids & posting
+            if not ids:
+                return set()
+        # Trigrams can all match without the word being contiguous, so confirm
+        return {entry_id for entry_id in ids if word in self.keys[entry_id]}
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        query = normalise(query)
+        if not query:
+            return []
+        if query in self.suggestions:
+            return self.suggestions[query][:limit]
+        return self.rank(query, self.candidates(query))[:limit]
+
+    def search(self, query, limit=50):
+        query = normalise(query)
+        if not query:
+            return []
+        return self.rank(query, self.candidates(query))[:limit]
+
+
+def load_entries(database=DATABASE_FILE):
+    """Reads every searchable name and the filtered page it should link to."""
+    conn = sqlite3.connect(database)
+    try:
+        cursor = conn.cursor()
+        countries = cursor.execute("SELECT name FROM Country ORDER BY name").fetchall()
+        regions = cursor.execute("SELECT region FROM Region ORDER BY region").fetchall()
+        antigens = cursor.execute("SELECT name FROM Antigen ORDER BY name").fetchall()
+        infections = cursor.execute("SELECT description FROM Infection_Type ORDER BY description").fetchall()
+        latest_year = cursor.execute("SELECT MAX(year) FROM InfectionData").fetchone()[0]
+    finally:
+        conn.close()
+
+    entries = []
+    for (name,) in countries:
+        entries.append((name, "Country", "/page2?" + urlencode({"country": name})))
+    for (name,) in regions:
+        entries.append((name, "Region", "/page2?" + urlencode({"region": name})))
+    for (name,) in antigens:
+        entries.append((name, "Antigen", "/page2?" + urlencode({"antigen_type": name})))
+    for (name,) in infections:
+        entries.append((name, "Infection", "/page4?" + urlencode({"inf_type": name})))
+        if latest_year is not None:
+            entries.append((f"{name} global rate {latest_year}", "Infection",
+                            "/page6?" + urlencode({"inf_type": name, "year": latest_year})))
+    return entries
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = SearchIndex(load_entries())
+    return _index
+
+
+def reset_index():
+    """Drops the cached index so the next search rebuilds it (call after loading new data)."""
+    global _index
+    _index = None
@@ -0,0 +1,154 @@
+import logging
+from datetime import date
+from html import escape
+
+import css_bundle
+import fts_index
+import pyhtml
+import search_index
+import wide_tables
+
+log = logging.getLogger(__name__)
+
+DATABASE_FILE = 'immunisation.db'
+
+# Rows listed per fact table under "Matching records"
+RECORD_LIMIT = 50
+
+# Free text naming a disease or antigen together with places, income groups or years
+# (e.g. "measles africa 2019") is resolved to IDs by fts_index and answers with the fact rows.
+# fact table -> (title, measure column heading, columns, dimension group it needs, its ID column)
+RECORD_SOURCES = {
+    "InfectionWide": ("Infection cases", "Cases per 100k", "f.description, f.country_name, f.year, f.cases",
+                      "Infection_Type", "f.inf_type"),
+    "VaccinationWide": ("Vaccination coverage", "Coverage (%)", "f.antigen_name, f.country_name, f.year, f.coverage",
+                        "Antigen", "f.antigen"),
+}
+
+
+def matching_records(query):
+    """[(title, measure heading, rows)] for the fact tables the query names a disease/antigen of,
+    narrowed by the countries, regions, income groups and years it also names."""
+    matches = fts_index.lookup(query)
+    conditions, params = [], []
+    places = [fts_index.id_filter(column, matches[group])
+              for group, column in (("Country", "c.CountryID"), ("Region", "c.region")) if group in matches]
+    if places:
+        # "africa" may hit a region and a country name alike: either one places the row
+        conditions.append("(" + " OR ".join(sql for sql, _ in places) + ")")
+        params += [param for _, place_params in places for param in place_params]
+    for group, column in (("Economy", "c.economy"), ("year", "f.year")):
+        if matches.get(group):
+            sql, group_params = fts_index.id_filter(column, matches[group])
+            conditions.append(sql)
+            params += group_params
+    if not conditions:
+        return []  # a name on its own is answered by the search results above
+
+    wide_tables.ensure_tables(DATABASE_FILE)
+    sections = []
+    for table, (title, heading, columns, group, id_column) in RECORD_SOURCES.items():
+        if group not in matches:
+            continue
+        subject_sql, subject_params = fts_index.id_filter(id_column, matches[group])
+        rows = pyhtml.get_results_from_query(DATABASE_FILE, f"""
+            SELECT {columns}
+            FROM {table} f
+            JOIN Country c ON c.CountryID = f.country
+            WHERE {" AND ".join([subject_sql] + conditions)}
+            ORDER BY f.year DESC, f.country_name
+            LIMIT ?;
+        """, subject_params + params + [RECORD_LIMIT])
+        sections.append((title, heading, rows))
+    return sections
+
+
+def get_page_html(form_data):
+    log.debug("Rendering Search results page...")
+
+    today = date.today().strftime("%d %B %Y")
+
+    # === Get user input ===
+    query = form_data.get("q", [""])[0].strip()
+
+    # === Look up the in-memory index (no SQL at request time) ===
+    results = search_index.get_index().search(query) if query else []
+    log.debug("Results found: %d", len(results))
+
+    # === Build table HTML ===
+    if not query:
+        rows_html = "<tr><td colspan='3' style='text-align:center;'>Type a country, region, antigen or infection in the search box.</td></tr>"
+    else:
+        rows_html = "".join(
+            f"<tr><td><a href=\"{escape(url)}\">{escape(label)}</a></td><td>{kind}</td><td><a href=\"{escape(url)}\">{escape(url.split('?')[0])}</a></td></tr>"
+            for label, kind, url in results
+        ) or f"<tr><td colspan='3'>No matches for \"{escape(query)}\".</td></tr>"
+
+    table_html = f"""
+    <table class='data-table'>
+        <thead><tr><th>Match</th><th>Type</th><th>Page</th></tr></thead>
+        <tbody>{rows_html}</tbody>
+    </table>
+    """
+
+    # === Fact rows for combined queries such as "measles africa 2019" (full-text index) ===
+    records_html = ""
+    if query:
+        try:
+            sections = matching_records(query)
+        except Exception as e:
+            log.error("Database error during record search: %s", e)
+            sections = []
+        for title, heading, rows in sections:
+            body = "".join(
+                "<tr>" + "".join(f"<td>{escape(str('' if cell is None else cell))}</td>" for cell in row) + "</tr>"
+                for row in rows
+            ) or "<tr><td colspan='4'>No records.</td></tr>"
+            records_html += f"""
+    <h3>{title}</h3>
+    <table class='data-table'>
+        <thead><tr><th>Name</th><th>Country</th><th>Year</th><th>{heading}</th></tr></thead>
+        <tbody>{body}</tbody>
+    </table>
+    """
+
+    # === HTML layout ===
+    return f"""<!DOCTYPE html>
+<html lang="en" class="{css_bundle.page_class('2b')}">
+<head>
+<meta charset="UTF-8">
+<title>Search | Immunisation Data</title>
+{css_bundle.stylesheet_link()}
+<script src="/static/js/search.js" defer></script>
+</head>
+<body>
+<div class="topnav">
+    <div class="logo-title">
+        <img src="/images/rmit.png" alt="Logo" class="logo">
+        <span>Immunisation Data Portal</span>
+    </div>
+    <div class="nav-links">
+        <a href="/">Home</a>
+        <a href="/page5">Mission</a>
+        <a href="/page2">Vaccination</a>
+        <a href="/page4">Infection</a>
+        <a href="/page3">Progress</a>
+        <a href="/page6">Analysis</a>
+    </div>
+    <div class="search-container">
+        <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
+    </div>
+</div>
+
+<div class="data-section">
+  <h3>Search results for "{escape(query)}"</h3>
+  {table_html}
+  {records_html}
+</div>
+
+<footer>
+  <p>Help | Contacts | Sources</p>
+  <p>Last Updated: {today}</p>
+</footer>
+</body>
+</html>"""
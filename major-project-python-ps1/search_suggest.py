@@ -0,0 +1,13 @@
+import json
+
+import search_index
+
+def page_response(form_data):
+    """Answers the search box's autocomplete requests with a small JSON list: (status, headers, body chunks)."""
+    query = form_data.get("q", [""])[0]
+    suggestions = [
+        {"label": label, "kind": kind, "url": url}
+        for label, kind, url in search_index.get_index().suggest(query)
+    ]
+    body = json.dumps(suggestions).encode('utf-8')
+    return 200, [("Content-type", "application/json"), ("Content-Length", str(len(body)))], [body]
@@ -0,0 +1,41 @@
+/*
+ * Autocomplete for the top-nav search box.
+ * Fills the box's <datalist> from /search/suggest as the user types and jumps
+ * straight to the filtered page when a suggestion is picked.
+ */
+document.addEventListener("DOMContentLoaded", function () {
+    var input = document.querySelector(".search-container input[name=q]");
+    var list = document.getElementById("search-suggestions");
+    if (!input || !list) {
+        return;
+    }
+    var urls = {};
+
+    input.addEventListener("input", function () {
+        var query = input.value;
+        if (urls[query]) {
+            window.location = urls[query];
+            return;
+        }
+        if (!query.trim()) {
+            list.innerHTML = "";
+            return;
+        }
+        fetch("/search/suggest?q=" + encodeURIComponent(query))
+            .then(function (response) { return response.json(); })
+            .then(function (suggestions) {
+                if (input.value !== query) {
+                    return; // a newer keystroke already replaced this request
+                }
+                urls = {};
+                list.innerHTML = "";
+                suggestions.forEach(function (item) {
+                    urls[item.label] = item.url;
+                    var option = document.createElement("option");
+                    option.value = item.label;
+                    option.label = item.kind;
+                    list.appendChild(option);
+                });
+            });
+    });
+});
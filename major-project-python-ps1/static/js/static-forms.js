@@ -0,0 +1,37 @@
+/*
+ * Form handling for the static export (static_export.py).
+ * A plain file server ignores query strings, so a form marked data-static-form
+ * navigates to the exported file for the chosen values instead of submitting.
+ * The file name is built exactly like static_export.static_url().
+ */
+function staticSlug(value) {
+    return value.toLowerCase().replace(/[^a-z0-9]+/g, "-").replace(/^-+|-+$/g, "");
+}
+
+document.addEventListener("submit", function (event) {
+    var form = event.target;
+    if (!form.hasAttribute("data-static-form")) {
+        return;
+    }
+    event.preventDefault();
+
+    var values = {};
+    var data = new FormData(form);
+    if (event.submitter && event.submitter.name) {
+        data.append(event.submitter.name, event.submitter.value);
+    }
+    data.forEach(function (value, name) {
+        if (value !== "") {
+            (values[name] = values[name] || []).push(value);
+        }
+    });
+
+    var parts = [];
+    Object.keys(values).sort().forEach(function (name) {
+        values[name].forEach(function (value) {
+            parts.push(name + "-" + staticSlug(value));
+        });
+    });
+    var base = form.getAttribute("data-static-form");
+    window.location.href = base + (parts.length ? parts.join("--") + ".html" : "");
+});
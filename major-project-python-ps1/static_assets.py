@@ -0,0 +1,228 @@
+#Static files (/static/..., /images/...) for both servers.
+#Small files are kept in memory together with their ready-made headers; big ones are sent
+#straight from the file to the socket with sendfile(). Every response carries an ETag and
+#Last-Modified so browsers can revalidate with a 304, single byte ranges get a 206, and
+#fingerprinted URLs (see asset_url) are marked as cacheable for a year.
+
+import email.utils
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from urllib.parse import unquote
+
+# Files up to this size are held in memory; bigger ones are sent with sendfile()
+SMALL_FILE_BYTES = 256 * 1024
+
+# Memory all cached files may take up together
+MEMORY_CACHE_BYTES = 16 * 1024 * 1024
+
+# The only folders (under the working directory) files are served from; the CSS bundle is built into static/
+STATIC_DIRS = ("static", "images")
+
+FINGERPRINT_LENGTH = 10
+
+# name.<fingerprint>.ext, the form asset_url() produces
+FINGERPRINTED = re.compile(r"^(.*)\.([0-9a-f]{%d})(\.[^./]+)$" % FINGERPRINT_LENGTH)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def content_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+
+class Asset:
+    """One file as it is on disk right now, with the headers every response for it shares."""
+    def __init__(self, path, stat, body=None, immutable=False):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.body = body  # the file's bytes for small files, None for sendfile()
+        self.etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        self.headers = [
+            ("Content-Type", content_type),
+            ("Last-Modified", self.last_modified),
+            ("ETag", self.etag),
+            ("Accept-Ranges", "bytes"),
+            ("Cache-Control", IMMUTABLE if immutable else REVALIDATE),
+        ]
+
+    def not_modified(self, request_headers):
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or self.etag in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return self.mtime_ns // 1_000_000_000 <= since
+        return False
+
+    def requested_range(self, request_headers):
+        """(start, length) of a satisfiable single-range request, "unsatisfiable", or None for the whole file."""
+        header = request_headers.get("range")
+        if not header or not header.startswith("bytes="):
+            return None
+        if_range = request_headers.get("if-range")
+        if if_range and if_range.strip() not in (self.etag, self.last_modified):
+            return None  # the file changed since the client's partial copy: send all of it
+        ranges = header[len("bytes="):].split(",")
+        if len(ranges) != 1:
+            return None  # multipart/byteranges is not supported; the whole file is a valid answer
+        first, _, last = ranges[0].strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last), self.size - 1) if last else self.size - 1
+            else:
+                start = max(self.size - int(last), 0)  # "bytes=-N": the last N bytes
+                end = self.size - 1
+        except ValueError:
+            return None
+        if start >= self.size or end < start:
+            return "unsatisfiable"
+        return start, end - start + 1
+
+    def plan(self, request_headers):
+        """Returns (status, headers, (start, length) of the body to send or None).
+
+        request_headers needs a case-insensitive or lower-case get(), e.g. an http.server
+        handler's headers or the asyncio server's header dict.
+        """
+        if self.not_modified(request_headers):
+            return 304, [(name, value) for name, value in self.headers if name in ("ETag", "Last-Modified", "Cache-Control")], None
+        byte_range = self.requested_range(request_headers)
+        if byte_range == "unsatisfiable":
+            return 416, [("Content-Range", f"bytes */{self.size}"), ("Content-Length", "0")], None
+        if byte_range is None:
+            return 200, self.headers + [("Content-Length", str(self.size))], (0, self.size)
+        start, length = byte_range
+        return 206, self.headers + [
+            ("Content-Range", f"bytes {start}-{start + length - 1}/{self.size}"),
+            ("Content-Length", str(length)),
+        ], byte_range
+
+
+class StaticFiles:
+    """Looks up files in the STATIC_DIRS folders, keeping small ones in memory.
+
+    Every lookup checks the file's size and modification time, so edited files are picked up
+    without a restart.
+    """
+    def __init__(self, small_file_bytes=SMALL_FILE_BYTES, memory_bytes=MEMORY_CACHE_BYTES):
+        self.lock = threading.Lock()
+        self.small_file_bytes = small_file_bytes
+        self.memory_bytes = memory_bytes
+        self.cached_bytes = 0
+        self.assets = {}        # url path -> Asset
+        self.fingerprints = {}  # file path -> (size, mtime_ns, fingerprint)
+
+    def file_path(self, url_path):
+        """Maps a URL path onto a file in one of the STATIC_DIRS, refusing anything else (the database,
+        the sources, prerendered/)."""
+        parts = [part for part in posixpath.normpath(unquote(url_path)).split("/") if part and part not in (".", "..")]
+        if len(parts) < 2 or parts[0] not in STATIC_DIRS:
+            return None
+        path = os.path.join(os.getcwd(), *parts)
+        return path if os.path.isfile(path) else None
+
+    def fingerprint(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            known = self.fingerprints.get(path)
+        if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+        fingerprint = content_fingerprint(path)
+        with self.lock:
+            self.fingerprints[path] = (stat.st_size, stat.st_mtime_ns, fingerprint)
+        return fingerprint
+
+    def lookup(self, url_path):
+        """The Asset for a URL path, or None if there is no such file (or the fingerprint is out of date)."""
+        path = self.file_path(url_path)
+        immutable = False
+        if path is None:
+            match = FINGERPRINTED.match(url_path)
+            if not match:
+                return None
+            path = self.file_path(match.group(1) + match.group(3))
+            # An old fingerprint must not be cached for a year against the new content
+            if path is None or self.fingerprint(path) != match.group(2):
+                return None
+            immutable = True
+
+        stat = os.stat(path)
+        with self.lock:
+            asset = self.assets.get(url_path)
+        if asset is not None and (asset.size, asset.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return asset
+
+        body = None
+        if stat.st_size <= self.small_file_bytes:
+            with open(path, "rb") as f:
+                body = f.read()
+        asset = Asset(path, stat, body, immutable)
+        with self.lock:
+            old = self.assets.pop(url_path, None)
+            if old is not None and old.body is not None:
+                self.cached_bytes -= old.size
+            if body is None or self.cached_bytes + asset.size <= self.memory_bytes:
+                self.assets[url_path] = asset
+                if body is not None:
+                    self.cached_bytes += asset.size
+        return asset
+
+    def asset_url(self, url_path):
+        """The fingerprinted URL for a static file, e.g. /static/css/2a.css -> /static/css/2a.1f2e3d4c5b.css.
+
+        Pages that link to this URL can be cached by browsers for a year; the URL changes
+        whenever the file does.
+        """
+        path = self.file_path(url_path)
+        if path is None:
+            return url_path
+        root, extension = posixpath.splitext(url_path)
+        return f"{root}.{self.fingerprint(path)}{extension}"
+
+
+static_files = StaticFiles()
+
+
+def asset_url(url_path):
+    return static_files.asset_url(url_path)
+
+
+def send_static(handler, url_path, head_only=False):
+    """Answers a GET or HEAD for a static file on an http.server request handler."""
+    asset = static_files.lookup(url_path)
+    if asset is None:
+        handler.send_error(404, "File not found")
+        return
+    status, headers, byte_range = asset.plan(handler.headers)
+    handler.send_response(status)
+    for name, value in headers:
+        handler.send_header(name, value)
+    handler.end_headers()
+    if head_only or byte_range is None:
+        return
+    start, length = byte_range
+    if asset.body is not None:
+        handler.wfile.write(asset.body[start:start + length])
+    else:
+        # socket.sendfile() uses os.sendfile(): the kernel copies the file to the socket
+        with open(asset.path, "rb") as f:
+            handler.connection.sendfile(f, start, length)
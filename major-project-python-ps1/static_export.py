@@ -0,0 +1,175 @@
+#Static-site export: the portal as plain files that any static web server or CDN can serve.
+#Every page that defines prerender_form_data() (see prerender.py) is rendered for each of its
+#parameter combinations into its own file. Links and forms are rewritten to those files, and
+#static/ and images/ are copied under content-fingerprinted names. Routes that need Python
+#(free-text filters, search, CSV export) can be pointed at a live portal with --dynamic-base;
+#otherwise their links are left as they are.
+#
+#   python demo2.py --export-static=site/
+#   python demo2.py --export-static=site/ --dynamic-base=https://portal.example.org
+#
+#The export is meant to be served from the root of its host name.
+
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import shutil
+from urllib.parse import parse_qs, urljoin, urlparse
+
+import pyhtml
+import static_assets
+
+log = logging.getLogger(__name__)
+
+ASSET_DIRS = ["static", "images"]
+
+# Included in every exported page; turns form submissions into links to the exported files
+FORMS_SCRIPT = "/static/js/static-forms.js"
+
+URL_ATTRIBUTE = re.compile(r'\b(href|src|action)="([^"]*)"')
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+FORM = re.compile(r"<form\b([^>]*)>(.*?)</form>", re.S)
+FIELD_NAME = re.compile(r'<(?:input|select|textarea|button)\b[^>]*\bname="([^"]*)"')
+
+
+def slug(value):
+    """Same as staticSlug() in static-forms.js."""
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+
+def static_url(path, form_key):
+    """URL of the exported file for a route and a normalised form, e.g. /page6/inf_type-measles--year-2019.html."""
+    base = path.rstrip("/") + "/"
+    if not form_key:
+        return base
+    return base + "--".join(f"{name}-{slug(value)}" for name, values in form_key for value in values) + ".html"
+
+
+def output_path(out_dir, url):
+    if url.endswith("/"):
+        url += "index.html"
+    return os.path.join(out_dir, *url.strip("/").split("/"))
+
+
+def fingerprinted(url, content):
+    root, extension = posixpath.splitext(url)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:10]}{extension}"
+
+
+def copy_assets(out_dir, asset_dirs=ASSET_DIRS):
+    """Copies the asset directories under fingerprinted names; returns original URL -> fingerprinted URL.
+
+    Stylesheets are copied last, after the url(...) references inside them have been
+    rewritten, so their fingerprints cover the images they point at.
+    """
+    files = []
+    for asset_dir in asset_dirs:
+        for folder, _, names in os.walk(asset_dir):
+            for name in sorted(names):
+                files.append(os.path.join(folder, name))
+    files.sort(key=lambda path: path.endswith(".css"))
+
+    assets = {}
+    for path in files:
+        url = "/" + "/".join(os.path.normpath(path).split(os.sep))
+        with open(path, "rb") as f:
+            content = f.read()
+        if path.endswith(".css"):
+            def rewrite(match, url=url):
+                target = assets.get(urljoin(url, match.group(2)))
+                return f"url({match.group(1)}{target}{match.group(1)})" if target else match.group(0)
+            content = CSS_URL.sub(rewrite, content.decode("utf-8")).encode("utf-8")
+        assets[url] = fingerprinted(url, content)
+        destination = output_path(out_dir, assets[url])
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, "wb") as f:
+            f.write(content)
+    return assets
+
+
+class LinkRewriter:
+    """Maps the URLs in a rendered page onto the exported site."""
+    def __init__(self, pages, exported, field_names, assets, dynamic_base):
+        self.pages = pages
+        self.exported = exported        # (route, form key) -> exported URL
+        self.field_names = field_names  # route -> parameter names its exported files cover
+        self.assets = assets
+        self.dynamic_base = dynamic_base.rstrip("/")
+
+    def rewrite_url(self, url, page_path):
+        if not url or url.startswith(("#", "mailto:", "javascript:")) or urlparse(url).scheme:
+            return url
+        parsed = urlparse(urljoin(page_path, url))
+        if parsed.path in self.assets:
+            return self.assets[parsed.path]
+        fingerprint = static_assets.FINGERPRINTED.match(parsed.path)
+        if fingerprint and fingerprint.group(1) + fingerprint.group(3) in self.assets:
+            # Already fingerprinted by the live server (e.g. the CSS bundle link)
+            return self.assets[fingerprint.group(1) + fingerprint.group(3)]
+        key = (parsed.path, pyhtml.normalise_form_data(parse_qs(parsed.query)))
+        if key in self.exported:
+            return self.exported[key]
+        if parsed.path in self.pages and self.dynamic_base:
+            return self.dynamic_base + parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        return url
+
+    def rewrite_form(self, match, page_path):
+        attributes, body = match.groups()
+        action = re.search(r'\baction="([^"]*)"', attributes)
+        target = urlparse(urljoin(page_path, action.group(1) if action else page_path)).path
+        names = set(FIELD_NAME.findall(body))
+        if target in self.field_names and names <= self.field_names[target]:
+            # Submitting navigates to the exported file for the chosen values (static-forms.js)
+            attributes += f' data-static-form="{static_url(target, ())}"'
+        elif target in self.pages and self.dynamic_base:
+            live_action = f'action="{self.dynamic_base}{target}"'
+            attributes = re.sub(r'\baction="[^"]*"', live_action, attributes) if action else f"{attributes} {live_action}"
+        return f"<form{attributes}>{body}</form>"
+
+    def rewrite_page(self, html, page_path):
+        html = FORM.sub(lambda match: self.rewrite_form(match, page_path), html)
+        # Form actions were settled above; only links and sources are rewritten here
+        html = URL_ATTRIBUTE.sub(
+            lambda match: match.group(0) if match.group(1) == "action"
+            else f'{match.group(1)}="{self.rewrite_url(match.group(2), page_path)}"', html)
+        script = self.assets.get(FORMS_SCRIPT)
+        if script and 'data-static-form="' in html:
+            html = html.replace("</head>", f'<script src="{script}" defer></script>\n</head>', 1)
+        return html
+
+
+def export_site(pages, out_dir, dynamic_base="", asset_dirs=ASSET_DIRS):
+    """Writes the static site into out_dir (replacing it); returns (pages written, assets copied)."""
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    assets = copy_assets(out_dir, asset_dirs)
+
+    # Render first, so links only ever point at pages that were actually exported
+    rendered = []
+    exported = {}
+    field_names = {}
+    for path, page in sorted(pages.items()):
+        if not hasattr(page, "prerender_form_data"):
+            continue
+        names = field_names.setdefault(path, set())
+        for form_data in page.prerender_form_data():
+            names.update(form_data)
+            form_key = pyhtml.normalise_form_data(form_data)
+            try:
+                html = page.get_page_html(form_data)
+            except Exception as e:
+                log.exception("Could not export %s %s: %s", path, form_key, e)
+                continue
+            exported[(path, form_key)] = static_url(path, form_key)
+            rendered.append((path, form_key, html))
+
+    rewriter = LinkRewriter(pages, exported, field_names, assets, dynamic_base)
+    for path, form_key, html in rendered:
+        destination = output_path(out_dir, exported[(path, form_key)])
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, "w", encoding="utf-8") as f:
+            f.write(rewriter.rewrite_page(html, path))
+    written = len(rendered)
+    return written, len(assets)
@@ -1,5 +1,9 @@
+import logging
 from datetime import date
 import sqlite3
+import css_bundle
+
+log = logging.getLogger(__name__)
 
 # --- SECURE Database Connection Setup ---
 DATABASE_FILE = 'immunisation.db'
@@ -8,9 +12,13 @@ DATABASE_FILE = 'immunisation.db'
 # the simpler sqlite3 logic is acceptable, but a secure pattern is best practice.
 # We keep the original structure for simplicity, ensuring it connects.
 
+def prerender_form_data():
+    """The page takes no parameters, so one pre-rendered copy answers every request (see prerender.py)."""
+    return [{}]
+
 def get_page_html(form_data):
     # Print statement for debugging/logging
-    print("About to return Home page...")
+    log.debug("About to return Home page...")
 
     # Get today's date in a specified format
     today = date.today().strftime("%d %B %Y")
@@ -54,7 +62,7 @@ def get_page_html(form_data):
         total_countries = total_countries_raw[0] if total_countries_raw and total_countries_raw[0] is not None else "N/A"
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        log.error("Database error: %s", e)
         personas = []
         team = []
         total_vacc_doses = "DB ERROR"
@@ -92,11 +100,12 @@ def get_page_html(form_data):
 
     # === Final HTML Layout ===
     page_html = f"""<!DOCTYPE html>
-<html lang="en">
+<html lang="en" class="{css_bundle.page_class('1a')}">
 <head>
 <meta charset="UTF-8">
 <title>Home | Immunisation Data Portal</title>
-<link rel="stylesheet" href="/static/css/1a.css">
+{css_bundle.stylesheet_link()}
+<script src="/static/js/search.js" defer></script>
 </head>
 <body>
     <div class="topnav">
@@ -113,7 +122,7 @@ def get_page_html(form_data):
             <a href="/page6">Analysis</a>
         </div>
         <div class="search-container">
-            <input type="text" placeholder="Search...">
+            <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
         </div>
     </div>
 
@@ -1,35 +1,43 @@
+import logging
 import sqlite3
+import css_bundle
+import lookup_keys
+import pyhtml
+import trigram_index
+import wide_tables
 from datetime import date
+from urllib.parse import urlencode
+
+log = logging.getLogger(__name__)
 
 # --- SECURE Database Connection Setup ---
 DATABASE_FILE = 'immunisation.db'
 
-def fetch_data(query, params=()):
-    """Connects to the database and executes a query using prepared statements."""
-    conn = None
+def iter_data(query, params=(), batch_size=None):
+    """Yields the rows of a query run with prepared statements, fetching them from SQLite in batches."""
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
         # Execute query with parameters for security (Prepared Statement)
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        return results
+        yield from pyhtml.iter_results_from_query(DATABASE_FILE, query, params, batch_size)
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        log.error("Database error: %s", e)
+
+def fetch_data(query, params=()):
+    """Executes a query using prepared statements; repeated queries are served from pyhtml's query cache."""
+    try:
+        return pyhtml.get_results_from_query(DATABASE_FILE, query, params)
+    except sqlite3.Error as e:
+        log.error("Database error: %s", e)
         return []
-    finally:
-        if conn:
-            conn.close()
 # ------------------------------------------------------------------
 
 def get_page_html(form_data):
-    print("Rendering Vaccination Data Filter page...")
+    log.debug("Rendering Vaccination Data Filter page...")
 
     today = date.today().strftime("%d %B %Y")
 
     # === Get user inputs ===
     country_name = form_data.get("country", [""])[0]
-    region = form_data.get("region", [""])[0]
+    region = lookup_keys.lookup_key(form_data.get("region", [""])[0])
     antigen_type = form_data.get("antigen_type", [""])[0]
     year = form_data.get("year", [""])[0]
 
@@ -37,25 +45,24 @@ def get_page_html(form_data):
     filters = []
     params = []
     
-    # 1. Filter by Country Name (uses LIKE for partial matching)
+    # 1. Filter by Country Name (partial match, resolved to country IDs through the trigram index)
     if country_name:
-        # SECURE: Use ? placeholder for the value
-        filters.append("C.name LIKE ?")
-        # Add the actual value (with wildcards) to the params list
-        params.append(f'%{country_name}%')
+        # SECURE: the value is passed as a ? parameter
+        condition, condition_params = trigram_index.substring_filter("V.country", "Country", country_name)
+        filters.append(condition)
+        params.extend(condition_params)
 
-    # 2. Filter by Region Name (exact match)
+    # 2. Filter by Region Name (case-insensitive exact match on the NOCASE lookup index)
     if region:
-        # SECURE: Use ? placeholder for the value
-        # Note: TRIM(LOWER(?)) is necessary for case-insensitive/robust matching in SQL
-        filters.append("TRIM(LOWER(R.name)) = TRIM(LOWER(?))")
+        # SECURE: Use ? placeholder for the value (already trimmed above)
+        filters.append(lookup_keys.equals("V.region_name"))
         params.append(region)
 
-    # 3. Filter by Antigen Type (uses LIKE for partial matching)
+    # 3. Filter by Antigen Type (partial match, resolved to antigen IDs through the trigram index)
     if antigen_type:
-        # SECURE: Use ? placeholder for the value
-        filters.append("A.AntigenName LIKE ?")
-        params.append(f'%{antigen_type}%')
+        condition, condition_params = trigram_index.substring_filter("V.antigen", "Antigen", antigen_type)
+        filters.append(condition)
+        params.extend(condition_params)
         
     # 4. Filter by Year (must be an exact match)
     if year and year.isdigit():
@@ -68,27 +75,34 @@ def get_page_html(form_data):
     where_clause = "WHERE " + " AND ".join(filters) if filters else ""
 
     # === SQL Query for Vaccination Data (Detailed View) ===
+    # VaccinationWide already has the country, region and antigen names joined in (wide_tables.py)
     query = f"""
     SELECT
-        C.name,           -- Index 0: Country
-        R.name,           -- Index 1: Region
-        A.AntigenName,    -- Index 2: Antigen Type
+        V.country_name,   -- Index 0: Country
+        V.region_name,    -- Index 1: Region
+        V.antigen_name,   -- Index 2: Antigen Type
         V.year,           -- Index 3: Year
         V.target_num,     -- Index 4: Target Population
         V.doses,          -- Index 5: Doses Administered
         ROUND(V.coverage, 2) -- Index 6: Coverage Rate (Rounded to 2 decimal places)
-    FROM Vaccination V
-    JOIN Country C ON V.country = C.CountryID
-    JOIN Region R ON C.region = R.RegionID
-    JOIN Antigen A ON V.antigen = A.AntigenID
+    FROM VaccinationWide V
     {where_clause}
-    ORDER BY C.name, V.year DESC;
+    ORDER BY V.country_name, V.year DESC;
     """
 
     # === Run the query SECURELY ===
+    try:
+        wide_tables.ensure_tables(DATABASE_FILE)
+        if country_name or antigen_type:
+            trigram_index.ensure_index(DATABASE_FILE)
+        if region:
+            lookup_keys.ensure_indexes(DATABASE_FILE)
+    except sqlite3.Error as e:
+        log.error("Database error: %s", e)
     # Pass the query with placeholders and the list of parameters to the secure function
-    results = fetch_data(query, params)
-    print("Results found:", len(results))
+    # Rows are turned into HTML as they come off the cursor, so the result set is never held as a list
+    results = iter_data(query, params)
+    row_count = 0
 
     # === Generate HTML Data Rows (CSS Grid format) ===
     
@@ -96,8 +110,10 @@ def get_page_html(form_data):
     def format_number(n):
         return f"{n:,.0f}" if isinstance(n, (int, float)) else n
 
-    data_rows_html = "".join(
-        f"""
+    def row_html(row):
+        nonlocal row_count
+        row_count += 1
+        return f"""
         <div class="data-entry">
             <div class="data-field country">{row[0]}</div>
             <div class="data-field region">{row[1]}</div>
@@ -108,17 +124,23 @@ def get_page_html(form_data):
             <div class="data-field percentage">{row[6]}%</div>
         </div>
         """
-        for row in results
-    ) or "<div class='data-field' style='grid-column: 1 / -1; text-align: center; padding: 15px;'>No data found based on filter criteria.</div>"
 
+    data_rows_html = "".join(map(row_html, results)) or "<div class='data-field' style='grid-column: 1 / -1; text-align: center; padding: 15px;'>No data found based on filter criteria.</div>"
+    log.debug("Results found: %d", row_count)
+
+
+    # === Link to download the same filtered rows as CSV ===
+    export_query = urlencode({"dataset": "vaccination", "country": country_name, "region": region,
+                              "antigen_type": antigen_type, "year": year})
 
     # === Final HTML Layout ===
     return f"""<!DOCTYPE html>
-<html lang="en">
+<html lang="en" class="{css_bundle.page_class('2a')}">
 <head>
 <meta charset="UTF-8">
 <title>Vaccination Data | Immunisation</title>
-<link rel="stylesheet" href="/static/css/2a.css">
+{css_bundle.stylesheet_link()}
+<script src="/static/js/search.js" defer></script>
 </head>
 <body>
 <div class="topnav">
@@ -135,7 +157,7 @@ def get_page_html(form_data):
         <a href="/page6">Analysis</a>
     </div>
     <div class="search-container">
-        <input type="text" placeholder="Search...">
+        <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
     </div>
 </div>
 
@@ -159,6 +181,7 @@ def get_page_html(form_data):
                 <button type="submit" class="apply">Apply Filter</button>
                 <a href="/page2" class="reset">Reset Filters</a>
             </div>
+            <a href="/export?{export_query}" class="export">Download CSV</a>
         </form>
     </div>
 
@@ -1,29 +1,94 @@
+import logging
 import sqlite3
+import css_bundle
+import prerender
+import pyhtml
+import rank_tables
+import trend_series
 from datetime import date
 
+log = logging.getLogger(__name__)
+
 # --- SECURE Database Connection Setup ---
 DATABASE_FILE = 'immunisation.db'
 
-def fetch_data(query, params=()):
-    """Connects to the database and executes a query using prepared statements."""
-    conn = None
+# Years offered by the Year dropdown
+YEARS = range(2000, 2026)
+
+# Countries listed under "Highest infection rates" and "Lowest infection rates"
+RANKED_COUNT = 5
+
+# Percentiles listed as the top tenth of countries
+TOP_BAND = (90, 100)
+
+def iter_data(query, params=(), batch_size=None):
+    """Yields the rows of a query run with prepared statements, fetching them from SQLite in batches."""
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
         # Execute query with parameters for security (Prepared Statement)
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        return results
+        yield from pyhtml.iter_results_from_query(DATABASE_FILE, query, params, batch_size)
+    except sqlite3.Error as e:
+        log.error("Database error: %s", e)
+
+def fetch_data(query, params=()):
+    """Executes a query using prepared statements; repeated queries are served from pyhtml's query cache."""
+    try:
+        return pyhtml.get_results_from_query(DATABASE_FILE, query, params)
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        log.error("Database error: %s", e)
         return []
-    finally:
-        if conn:
-            conn.close()
 # ------------------------------------------------------------------
 
+def sparkline(points, width=160, height=36):
+    """Inline SVG line of a series' rates, oldest year on the left."""
+    rates = [rate for _, rate, _, _ in points]
+    low, high = min(rates), max(rates)
+    span = (high - low) or 1
+    step = width / max(len(rates) - 1, 1)
+    coordinates = " ".join(f"{i * step:.1f},{height - (rate - low) / span * height:.1f}" for i, rate in enumerate(rates))
+    return f'<svg class="sparkline" width="{width}" height="{height}" viewBox="0 0 {width} {height}"><polyline points="{coordinates}"/></svg>'
+
+def trend_html(level, node, entity_name):
+    """Infection rate per disease and coverage per antigen for one entity, across all years."""
+    sections = []
+    for measure, title, unit in (("infection_rate", "Infection rate per 100,000", ""), ("coverage", "Vaccination coverage", "%")):
+        rows = []
+        for _, label, points in trend_series.get_series(measure, level, node):
+            first_year, last_year = points[0][0], points[-1][0]
+            _, rate, change, average = points[-1]
+            year_rows = "".join(
+                f"<tr><td>{y}</td><td>{r:,.2f}{unit}</td><td>{'' if c is None else f'{c:+,.2f}'}</td><td>{a:,.2f}{unit}</td></tr>"
+                for y, r, c, a in reversed(points))
+            rows.append(f"""
+            <tr>
+                <td>{label}</td>
+                <td>{sparkline(points)}</td>
+                <td>{first_year}&ndash;{last_year}</td>
+                <td>{rate:,.2f}{unit}</td>
+                <td>{'' if change is None else f'{change:+,.2f}'}</td>
+                <td>{average:,.2f}{unit}</td>
+            </tr>
+            <tr class="trend-years"><td colspan="6"><details><summary>Every year</summary>
+                <table><tr><th>Year</th><th>Rate</th><th>Change</th><th>{trend_series.MOVING_AVERAGE_YEARS}-year average</th></tr>{year_rows}</table>
+            </details></td></tr>""")
+        body = "".join(rows) or "<tr><td colspan='6'>No data for this entity.</td></tr>"
+        sections.append(f"""
+        <h4>{title}</h4>
+        <table class="trend-table">
+            <tr><th>Series</th><th>Trend</th><th>Years</th><th>Latest</th><th>Change</th><th>{trend_series.MOVING_AVERAGE_YEARS}-year average</th></tr>
+            {body}
+        </table>""")
+    return f"<h3>Trends for {entity_name}</h3>" + "".join(sections)
+
+def prerender_form_data():
+    """Every infection type / year combination the dropdowns can submit (see prerender.py).
+
+    Requests with a Country or Region for the trends are rendered on request.
+    """
+    infection_types = [row[0] for row in fetch_data("SELECT DISTINCT description FROM Infection_Type ORDER BY description;")]
+    return prerender.filter_combinations(inf_type=infection_types, year=[str(y) for y in YEARS])
+
 def get_page_html(form_data):
-    print("Rendering Global Infection Rate page...")
+    log.debug("Rendering Global Infection Rate page...")
 
     today = date.today().strftime("%d %B %Y")
 
@@ -36,8 +101,14 @@ def get_page_html(form_data):
     # === Extract filters ===
     inf_type = form_data.get("inf_type", [""])[0]
     year = form_data.get("year", [""])[0]
+    entity = form_data.get("entity", [""])[0]
 
     results = []
+    ranks = {}
+    highest = []
+    lowest = []
+    top_band = []
+    inf_type_id = None
     global_rate = None
     data_list_html = ""
 
@@ -82,7 +153,7 @@ def get_page_html(form_data):
                 results_query = f"""
                     SELECT 
                         c.name,
-                        r.name,
+                        r.region,
                         id.cases,
                         cp.population,
                         ROUND((id.cases * 1.0 / cp.population)*100000, 2) AS rate
@@ -98,10 +169,16 @@ def get_page_html(form_data):
                 
                 # SECURE: Pass inf_type_id, year, and global_rate as parameters
                 params = (inf_type_id, int(year), global_rate)
-                results = fetch_data(results_query, params)
+                results = iter_data(results_query, params)
+
+                # --- 4. Where each country ranks among all countries (precomputed) ---
+                ranks = rank_tables.ranks_by_name("infection_rate", inf_type_id, int(year))
+                highest = rank_tables.top_n("infection_rate", inf_type_id, int(year), RANKED_COUNT)
+                lowest = rank_tables.bottom_n("infection_rate", inf_type_id, int(year), RANKED_COUNT)
+                top_band = rank_tables.percentile_band("infection_rate", inf_type_id, int(year), *TOP_BAND)
 
         except Exception as e:
-            print("Database error during main query:", e)
+            log.error("Database error during main query: %s", e)
             results = []
 
     # === Generate HTML Data Rows (CSS Grid format) ===
@@ -120,31 +197,78 @@ def get_page_html(form_data):
                 <div class="data-field percentage">Infection Rate (%)</div>
             </div>
             """
-    if results:
-        # Format numbers and generate rows
-        for row in results:
-            country, region, cases, population, rate = row
-            data_list_html += f"""
+
+    def rank_label(rank):
+        if rank is None:
+            return ""
+        position, percentile, ranked = rank
+        return f"<span class=\"rank\">#{position} of {ranked} &middot; P{percentile:.0f}</span>"
+
+    # Format numbers and generate rows as the batches are fetched (into one page body)
+    entries_html = "".join(
+            f"""
             <div class="data-entry">
                 <div class="data-field country">{country}</div>
                 <div class="data-field region">{region}</div>
                 <div class="data-field cases">{cases:,.0f}</div>
                 <div class="data-field population">{population:,.0f}</div>
-                <div class="data-field percentage">{rate:,.2f}%</div>
+                <div class="data-field percentage">{rate:,.2f}%{rank_label(ranks.get(country))}</div>
             </div>
             """
+            for country, region, cases, population, rate in results)
+    if entries_html:
+        data_list_html += entries_html
     else:
         data_list_html += f"<div class='data-field' style='grid-column: 1 / -1; text-align: center; padding: 15px;'>No data found or global rate not calculated for {inf_type} in {year}.</div>"
 
     data_list_html += "</div>" # Close data-list-container
 
+    # === Countries with the highest and lowest rate, and the top tenth (precomputed ranks) ===
+    def ranked_table(title, rows):
+        if not rows:
+            return ""
+        table_rows = "".join(
+            f"<tr><td>{name or country}</td><td>{rate:,.2f}%</td><td>#{rank} of {ranked}</td></tr>"
+            for country, name, rate, rank, _, ranked in rows)
+        return f"""
+        <h4>{title}</h4>
+        <table class="trend-table">
+            <tr><th>Country</th><th>Infection Rate (%)</th><th>Rank</th></tr>
+            {table_rows}
+        </table>"""
+
+    ranked_html = ranked_table("Highest infection rates", highest) + ranked_table("Lowest infection rates", lowest)
+    if top_band:
+        names = ", ".join(name or country for country, name, *_ in top_band)
+        ranked_html += f"<p class=\"top-band\">Top {100 - TOP_BAND[0]}% of countries (P{TOP_BAND[0]} and above): {names}</p>"
+
+    # === Year-over-year trends for a country or region ===
+    trend_section_html = ""
+    if entity:
+        try:
+            resolved = trend_series.resolve_entity(entity)
+            if resolved:
+                trend_section_html = trend_html(*resolved)
+                level, node, entity_name = resolved
+                if level == "country" and inf_type_id is not None:
+                    # Where the chosen country stands in the selected year, whether or not it exceeds the global rate
+                    rank = rank_tables.country_rank("infection_rate", inf_type_id, int(year), node)
+                    standing = (f"ranks #{rank[3]} of {rank[5]} (P{rank[4]:.0f}) for {inf_type} in {year}" if rank
+                                else f"has no {inf_type} rate for {year}")
+                    trend_section_html = f"<p class=\"rank-standing\">{entity_name} {standing}.</p>" + trend_section_html
+            else:
+                trend_section_html = f"<h3>Trends</h3><p>No country or region called \"{entity}\".</p>"
+        except Exception as e:
+            log.error("Database error during trend query: %s", e)
+
     # === Final HTML Layout ===
     return f"""<!DOCTYPE html>
-<html lang="en">
+<html lang="en" class="{css_bundle.page_class('3a')}">
 <head>
 <meta charset="UTF-8">
 <title>Analysis | Global Infection Rate</title>
-<link rel="stylesheet" href="/static/css/3a.css">
+{css_bundle.stylesheet_link()}
+<script src="/static/js/search.js" defer></script>
 </head>
 <body>
 <div class="topnav">
@@ -161,7 +285,7 @@ def get_page_html(form_data):
         <a class="active" href="/page6">Analysis</a>
     </div>
     <div class="search-container">
-        <input type="text" placeholder="Search...">
+        <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
     </div>
 </div>
 
@@ -179,7 +303,7 @@ def get_page_html(form_data):
                 <label>Year:</label>
                 <select name="year">
                     <option value="">--Select Year--</option>
-                    {''.join(f"<option value='{y}' {'selected' if str(y)==year else ''}>{y}</option>" for y in range(2000,2026)) }
+                    {''.join(f"<option value='{y}' {'selected' if str(y)==year else ''}>{y}</option>" for y in YEARS) }
                 </select>
             </div>
 
@@ -188,11 +312,26 @@ def get_page_html(form_data):
                 <a href="/page6" class="reset">Reset</a>
             </div>
         </form>
+
+        <form method="get" action="/page3" class="filter-form trend-form">
+            <h2>Trends</h2>
+            <input type="hidden" name="inf_type" value="{inf_type}">
+            <input type="hidden" name="year" value="{year}">
+            <div class="filter-line">
+                <label>Country or Region:</label>
+                <input type="text" name="entity" value="{entity}" placeholder="e.g. Australia or World">
+            </div>
+            <div class="apply-reset">
+                <button type="submit" class="apply">Show Trends</button>
+            </div>
+        </form>
     </div>
 
     <div class="data-panel">
         <h3>{header_text}</h3>
         {data_list_html}
+        {ranked_html}
+        {trend_section_html}
     </div>
 </div>
 
@@ -1,8 +1,16 @@
+import logging
 from datetime import date
 import sqlite3
+import css_bundle
+
+log = logging.getLogger(__name__)
+
+def prerender_form_data():
+    """The page takes no parameters, so one pre-rendered copy answers every request (see prerender.py)."""
+    return [{}]
 
 def get_page_html(form_data):
-    print("About to return Home page...")
+    log.debug("About to return Home page...")
 
     today = date.today().strftime("%d %B %Y")
 
@@ -43,12 +51,13 @@ def get_page_html(form_data):
 
     # === Final HTML ===
     page_html = f"""<!DOCTYPE html>
-<html lang="en">
+<html lang="en" class="{css_bundle.page_class('1b')}">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Home | Immunization Data Project</title>
-    <link rel="stylesheet" href="/static/css/1b.css">
+    {css_bundle.stylesheet_link()}
+    <script src="/static/js/search.js" defer></script>
 </head>
 <body>
 
@@ -69,7 +78,7 @@ def get_page_html(form_data):
         </div>
 
         <div class="search-container">
-            <input type="text" placeholder="Search...">
+            <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
         </div>
     </div>
 
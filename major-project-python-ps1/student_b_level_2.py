@@ -1,68 +1,82 @@
+import logging
+import css_bundle
 import pyhtml
+import infection_cube
+import lookup_keys
+import trigram_index
+import wide_tables
 from datetime import date
+from urllib.parse import urlencode
+
+log = logging.getLogger(__name__)
 
 def get_page_html(form_data):
-    print("Rendering Infection Data Filter page...")
+    log.debug("Rendering Infection Data Filter page...")
 
     today = date.today().strftime("%d %B %Y")
 
     # === Get user inputs ===
-    economic_phase = form_data.get("economic_phase", [""])[0]
+    economic_phase = lookup_keys.lookup_key(form_data.get("economic_phase", [""])[0])
     inf_type = form_data.get("inf_type", [""])[0]
     year = form_data.get("year", [""])[0]
     summary_mode = form_data.get("summary", ["0"])[0]
 
     # === Build WHERE filters ===
     filters = []
+    params = []
     if economic_phase:
-      filters.append(f"TRIM(LOWER(e.phase)) = TRIM(LOWER('{economic_phase}'))")
+        filters.append(lookup_keys.equals("i.phase"))
+        params.append(economic_phase)
 
 
     if inf_type:
-        filters.append(f"it.description LIKE '%{inf_type}%'")
-    if year:
-        filters.append(f"i.year = {year}")
+        # Resolved to infection type IDs through the trigram index
+        condition, condition_params = trigram_index.substring_filter("i.inf_type", "Infection_Type", inf_type)
+        filters.append(condition)
+        params.extend(condition_params)
+    if year.isdigit():
+        # Anything but a plain year is ignored, as in summary mode (infection_cube) and export_data
+        filters.append("i.year = ?")
+        params.append(int(year))
     where_clause = "WHERE " + " AND ".join(filters) if filters else ""
 
-    # === Summarize or detailed mode ===
-    if summary_mode == "1":
-        query = f"""
+    # === Detailed mode query (summary mode is served from infection_cube) ===
+    # InfectionWide already has the disease, country and phase names joined in (wide_tables.py)
+    query = f"""
         SELECT 
-            it.description AS "Preventable Disease",
-            e.phase AS "Economic Phase",
-            i.year AS "Year",
-            ROUND(SUM(i.cases), 2) AS "Cases per 100k"
-        FROM InfectionData i
-        JOIN Infection_Type it ON i.inf_type = it.id
-        JOIN Country c ON i.country = c.CountryID
-        JOIN Economy e ON c.economy = e.economyID
-        {where_clause}
-        GROUP BY it.description, e.phase, i.year
-        ORDER BY e.phase, i.year;
-        """
-    else:
-        query = f"""
-        SELECT 
-            it.description AS "Preventable Disease",
-            c.name AS "Country",
-            e.phase AS "Economic Phase",
+            i.description AS "Preventable Disease",
+            i.country_name AS "Country",
+            i.phase AS "Economic Phase",
             i.year AS "Year",
             i.cases AS "Cases per 100k"
-        FROM InfectionData i
-        JOIN Infection_Type it ON i.inf_type = it.id
-        JOIN Country c ON i.country = c.CountryID
-        JOIN Economy e ON c.economy = e.economyID
+        FROM InfectionWide i
         {where_clause}
-        ORDER BY e.phase, c.name;
+        ORDER BY i.phase, i.country_name;
         """
 
-    # === Run the query ===
+    # === Run the query and build the rows ===
+    def row_html(row):
+        return "<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>"
+
     try:
-        results = pyhtml.get_results_from_query("immunisation.db", query)
-        print("Results found:", len(results))
+        if summary_mode == "1":
+            # Summary rows are rolled up from the pre-aggregated cube instead of joining InfectionData
+            cube_rows = infection_cube.query_cube(["phase", "year", "inf_type"],
+                                                  phase=economic_phase, inf_type=inf_type, year=year)
+            results = [(disease, phase, cube_year, cases) for phase, cube_year, disease, cases, _ in cube_rows]
+        else:
+            # Detailed rows are fetched in batches (the rendered rows still make up one page body)
+            wide_tables.ensure_tables("immunisation.db")
+            if inf_type:
+                trigram_index.ensure_index("immunisation.db")
+            if economic_phase:
+                lookup_keys.ensure_indexes("immunisation.db")
+            results = pyhtml.iter_results_from_query("immunisation.db", query, params)
+        row_list = [row_html(row) for row in results]
+        log.debug("Results found: %d", len(row_list))
     except Exception as e:
-        print("Database error:", e)
-        results = []
+        log.error("Database error: %s", e)
+        row_list = []
 
     # === Table setup ===
     if summary_mode == "1":
@@ -70,10 +84,7 @@ def get_page_html(form_data):
     else:
         headers = ["Preventable Disease", "Country", "Economic Phase", "Year", "Cases per 100k"]
 
-    rows_html = "".join(
-        "<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>"
-        for row in results
-    ) or "<tr><td colspan='5'>No data found</td></tr>"
+    rows_html = "".join(row_list) or "<tr><td colspan='5'>No data found</td></tr>"
 
     table_html = f"""
     <table class='data-table'>
@@ -82,13 +93,18 @@ def get_page_html(form_data):
     </table>
     """
 
+    # === Link to download the same filtered rows as CSV ===
+    export_query = urlencode({"dataset": "infection", "economic_phase": economic_phase, "inf_type": inf_type,
+                              "year": year, "summary": summary_mode})
+
     # === HTML layout ===
     return f"""<!DOCTYPE html>
-<html lang="en">
+<html lang="en" class="{css_bundle.page_class('2b')}">
 <head>
 <meta charset="UTF-8">
 <title>Infection Data | Immunisation</title>
-<link rel="stylesheet" href="/static/css/2b.css">
+{css_bundle.stylesheet_link()}
+<script src="/static/js/search.js" defer></script>
 </head>
 <body>
 <div class="topnav">
@@ -105,7 +121,7 @@ def get_page_html(form_data):
         <a href="/page6">Analysis</a>
     </div>
     <div class="search-container">
-            <input type="text" placeholder="Search...">
+            <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
       </div>
 </div>
 
@@ -135,6 +151,7 @@ def get_page_html(form_data):
     <button type="submit" class="apply">Apply Filter</button>
     <a href="/page4" class="reset">Reset</a>
     <button type="submit" name="summary" value="1" class="summary">Summarize Data</button>
+    <a href="/export?{export_query}" class="export">Download CSV</a>
   </div>
 </form>
 
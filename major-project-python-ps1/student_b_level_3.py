@@ -1,8 +1,28 @@
+import logging
+import css_bundle
+import prerender
 import pyhtml
 from datetime import date
 
+log = logging.getLogger(__name__)
+
+# Years offered by the Year dropdown
+YEARS = range(2010, 2026)
+
+# Years pre-rendered and exported: the Analysis form on /page3 (student_a_level_3.YEARS) also
+# submits here, with years from 2000
+PRERENDER_YEARS = range(2000, 2026)
+
+def prerender_form_data():
+    """Every infection type / year combination the dropdowns can submit (see prerender.py)."""
+    infection_types = pyhtml.get_results_from_query(
+        "immunisation.db",
+        "SELECT DISTINCT description FROM Infection_Type ORDER BY description;"
+    )
+    return prerender.filter_combinations(inf_type=[row[0] for row in infection_types], year=[str(y) for y in PRERENDER_YEARS])
+
 def get_page_html(form_data):
-    print("Rendering Global Infection Rate page...")
+    log.debug("Rendering Global Infection Rate page...")
 
     today = date.today().strftime("%d %B %Y")
 
@@ -13,7 +33,7 @@ def get_page_html(form_data):
             "SELECT DISTINCT description FROM Infection_Type ORDER BY description;"
         )
     except Exception as e:
-        print("Dropdown load error:", e)
+        log.error("Dropdown load error: %s", e)
         infection_types = []
 
     # === Extract filters ===
@@ -64,7 +84,7 @@ def get_page_html(form_data):
             """
             results = pyhtml.get_results_from_query("immunisation.db", query)
         except Exception as e:
-            print("Database query error:", e)
+            log.error("Database query error: %s", e)
             results = []
 
     # === Build table HTML ===
@@ -96,11 +116,12 @@ def get_page_html(form_data):
 
     # === Return full HTML ===
     return f"""<!DOCTYPE html>
-<html lang="en">
+<html lang="en" class="{css_bundle.page_class('3b')}">
 <head>
 <meta charset="UTF-8">
 <title>Global Infection Rate | Immunisation Data</title>
-<link rel="stylesheet" href="/static/css/3b.css">
+{css_bundle.stylesheet_link()}
+<script src="/static/js/search.js" defer></script>
 <style>
 
 </style>
@@ -121,7 +142,7 @@ def get_page_html(form_data):
         <a class="active" href="/page6">Analysis</a>
     </div>
     <div class="search-container">
-            <input type="text" placeholder="Search...">
+            <form action="/search" method="get"><input type="text" name="q" placeholder="Search..." list="search-suggestions" autocomplete="off"><datalist id="search-suggestions"></datalist></form>
       </div>
 </div>
 
@@ -137,7 +158,7 @@ def get_page_html(form_data):
     <label>Year:</label>
     <select name="year">
       <option value="">--Select Year--</option>
-      {''.join(f"<option {'selected' if str(y)==year else ''}>{y}</option>" for y in range(2010,2026))}
+      {''.join(f"<option {'selected' if str(y)==year else ''}>{y}</option>" for y in YEARS)}
     </select>
   </div>
 
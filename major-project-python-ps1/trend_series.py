@@ -0,0 +1,91 @@
+import sqlite3
+
+import lookup_keys
+import pyhtml
+import region_rollup
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Year-by-year series for one country, region or the world, read from region_rollup:
+#   infection_rate: cases per 100,000 per infection type
+#   coverage:       doses as a % of the target population per antigen
+# The change from the previous reported year and the moving average are computed by window
+# functions in the same single pass over the rollup rows, which pyhtml's query cache keeps.
+SERIES = {
+    "infection_rate": ("cases", "LEFT JOIN Infection_Type it ON it.id = ru.category", "it.description"),
+    "coverage": ("doses", "LEFT JOIN Antigen a ON a.AntigenID = ru.category", "a.name"),
+}
+
+# Years averaged by the moving average (the current year and the ones before it)
+MOVING_AVERAGE_YEARS = 3
+
+
+def series_query(measure, window):
+    rollup_measure, join, label = SERIES[measure]
+    scale = region_rollup.MEASURES[rollup_measure][0]
+    return f"""
+        SELECT category, label, year, rate,
+               ROUND(rate - LAG(rate) OVER by_year, 2),
+               ROUND(AVG(rate) OVER (PARTITION BY category ORDER BY year ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW), 2)
+        FROM (
+            SELECT ru.category, COALESCE({label}, ru.category) AS label, ru.year,
+                   ROUND(ru.total * {scale}.0 / ru.base, 2) AS rate
+            FROM {region_rollup.ROLLUP_TABLE} ru
+            {join}
+            WHERE ru.measure = '{rollup_measure}' AND ru.level = ? AND ru.node = ?
+              AND ru.total IS NOT NULL AND ru.base > 0
+        )
+        WINDOW by_year AS (PARTITION BY category ORDER BY year)
+        ORDER BY label, year;
+    """
+
+
+def ensure_series_index(conn):
+    """One node's history across categories and years, in index order."""
+    region_rollup.ensure_rollup(conn)
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS {region_rollup.ROLLUP_TABLE}_node
+        ON {region_rollup.ROLLUP_TABLE} (measure, level, node, category, year)
+    """)
+
+
+def resolve_entity(name, database=DATABASE_FILE):
+    """Maps a country or region name (any case) to (level, node, display name), or None."""
+    name = lookup_keys.lookup_key(name)
+    if not name:
+        return None
+    if name.lower() in ("world", "global"):
+        return "global", region_rollup.GLOBAL_NODE, "World"
+    conn = sqlite3.connect(database)
+    try:
+        lookup_keys.ensure_lookup_indexes(conn)
+        row = conn.execute(f"SELECT CountryID, name FROM Country WHERE {lookup_keys.equals('name')}", (name,)).fetchone()
+        if row:
+            return "country", row[0], row[1]
+        row = conn.execute(f"SELECT RegionID, region FROM Region WHERE {lookup_keys.equals('region')}", (name,)).fetchone()
+        if row:
+            return "region", row[0], row[1]
+    finally:
+        conn.close()
+    return None
+
+
+def get_series(measure, level, node, window=MOVING_AVERAGE_YEARS, database=DATABASE_FILE):
+    """Every category's series for one node.
+
+    Returns [(category, label, [(year, rate, change, moving_average), ...]), ...]. change is the
+    difference from the previous reported year (None for the first). The rows come from
+    pyhtml.get_results_from_query, so they are cached until the database changes.
+    """
+    if measure not in SERIES:
+        raise ValueError(f"Unknown series '{measure}'. Use one of: {', '.join(SERIES)}")
+    pyhtml.prepare_database(database, ensure_series_index)
+    rows = pyhtml.get_results_from_query(database, series_query(measure, window), (level, node))
+
+    series = []
+    for category, label, year, rate, change, moving_average in rows:
+        if not series or series[-1][0] != category:
+            series.append((category, label, []))
+        series[-1][2].append((year, rate, change, moving_average))
+    return series
@@ -0,0 +1,109 @@
+import sqlite3
+
+import pyhtml
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Substring filters ("stral" -> Australia) on the dimension names the pages filter by.
+# The names are held in an FTS5 table with the trigram tokenizer, which answers
+# LIKE '%...%' from its index instead of testing every name. A page turns the typed text
+# into "fact.column IN (ids whose name matches)": SQLite resolves the IDs once and then
+# looks the fact rows up by key, rather than joining every fact row to its name first.
+TRIGRAM_TABLE = "NameTrigram"
+
+# source table -> (id column, name column)
+SOURCES = {
+    "Country": ("CountryID", "name"),
+    "Antigen": ("AntigenID", "name"),
+    "Infection_Type": ("id", "description"),
+}
+
+# Fact-table indexes the IN lookups use (InfectionData's primary key already starts with inf_type)
+FACT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS Vaccination_country ON Vaccination (country, year)",
+    "CREATE INDEX IF NOT EXISTS Vaccination_antigen ON Vaccination (antigen, year)",
+]
+
+
+def build_trigram_index(conn):
+    """(Re)creates the trigram table from the dimension tables and adds triggers that keep it in sync."""
+    conn.execute(f"DROP TABLE IF EXISTS {TRIGRAM_TABLE}")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {TRIGRAM_TABLE} USING fts5(
+            kind UNINDEXED,
+            ref UNINDEXED,
+            name,
+            tokenize = 'trigram'
+        )
+    """)
+    for table, (id_column, name_column) in SOURCES.items():
+        conn.execute(f"INSERT INTO {TRIGRAM_TABLE} (kind, ref, name) "
+                     f"SELECT '{table}', {id_column}, {name_column} FROM {table}")
+        # One statement at a time: executescript() would commit the build half-way
+        for action in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_trigram_{action}")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_trigram_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {TRIGRAM_TABLE} (kind, ref, name) VALUES ('{table}', NEW.{id_column}, NEW.{name_column});
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_trigram_update AFTER UPDATE ON {table} BEGIN
+                DELETE FROM {TRIGRAM_TABLE} WHERE kind = '{table}' AND ref = OLD.{id_column};
+                INSERT INTO {TRIGRAM_TABLE} (kind, ref, name) VALUES ('{table}', NEW.{id_column}, NEW.{name_column});
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_trigram_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {TRIGRAM_TABLE} WHERE kind = '{table}' AND ref = OLD.{id_column};
+            END""")
+    for statement in FACT_INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+
+def ensure_trigram_index(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TRIGRAM_TABLE,)
+    ).fetchone()
+    if not exists:
+        build_trigram_index(conn)
+
+
+def ensure_index(database=DATABASE_FILE):
+    """ensure_trigram_index() for pages that query through pyhtml; checks the database once per version."""
+    pyhtml.prepare_database(database, ensure_trigram_index)
+
+
+def substring_filter(column, table, text):
+    """An indexed "column IN (...)" condition for the rows whose `table` name contains `text`.
+
+    Matches exactly what "name LIKE '%text%'" matched (case-insensitive, % and _ still work as
+    wildcards). Returns (sql, params).
+    """
+    return (f"{column} IN (SELECT ref FROM {TRIGRAM_TABLE} WHERE kind = '{table}' AND name LIKE ?)",
+            [f"%{text}%"])
+
+
+def substring_ids(table, text, database=DATABASE_FILE):
+    """The IDs of the `table` rows whose name contains `text`."""
+    conn = sqlite3.connect(database)
+    try:
+        ensure_trigram_index(conn)
+        return [row[0] for row in conn.execute(
+            f"SELECT ref FROM {TRIGRAM_TABLE} WHERE kind = ? AND name LIKE ? ORDER BY name",
+            (table, f"%{text}%"))]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 2:
+        print(substring_ids(sys.argv[1], " ".join(sys.argv[2:])))
+    else:
+        connection = sqlite3.connect(DATABASE_FILE)
+        build_trigram_index(connection)
+        count = connection.execute(f"SELECT COUNT(*) FROM {TRIGRAM_TABLE}").fetchone()[0]
+        connection.close()
+        print(f"Rebuilt {TRIGRAM_TABLE} with {count} names.")
@@ -0,0 +1,160 @@
+import sqlite3
+
+import pyhtml
+import rank_tables
+import region_rollup
+
+# --- Database Connection Setup ---
+DATABASE_FILE = 'immunisation.db'
+
+# Read tables for the filter pages: every fact row with the names it is shown and filtered by
+# already joined in, so /page2 and /page4 read one table with no joins at request time.
+#   VaccinationWide: Vaccination + Country + Region + Antigen  (/page2)
+#   InfectionWide:   InfectionData + Infection_Type + Country + Economy  (/page4)
+# They hold exactly the rows the page joins used to produce (inner joins, so facts for a
+# country without a region or economy are left out, as before). The ingest functions refresh the
+# rows they touch (infection_cube.ingest_infection_data for InfectionWide, ingest_vaccination_data
+# below for VaccinationWide); run this module to rebuild both after a bulk load.
+VACCINATION_WIDE = "VaccinationWide"
+INFECTION_WIDE = "InfectionWide"
+
+# table -> (columns, key columns, fact table alias, fact rows as they go into the table; {where} narrows the facts)
+TABLES = {
+    VACCINATION_WIDE: (
+        """inf_type     TEXT (3) NOT NULL,
+           antigen      TEXT (6) NOT NULL,
+           country      TEXT (3) NOT NULL,
+           year         INTEGER  NOT NULL,
+           country_name TEXT,
+           region       TEXT (3),
+           region_name  TEXT,
+           antigen_name TEXT,
+           target_num   REAL,
+           doses        REAL,
+           coverage     REAL""",
+        ["inf_type", "antigen", "country", "year"],
+        "V",
+        """SELECT V.inf_type, V.antigen, V.country, V.year, C.name, C.region, R.region, A.name,
+                  V.target_num, V.doses, V.coverage
+           FROM Vaccination V
+           JOIN Country C ON V.country = C.CountryID
+           JOIN Region R ON C.region = R.RegionID
+           JOIN Antigen A ON V.antigen = A.AntigenID
+           {where}""",
+    ),
+    INFECTION_WIDE: (
+        """inf_type     TEXT (3) NOT NULL,
+           country      TEXT (3) NOT NULL,
+           year         INTEGER  NOT NULL,
+           description  TEXT,
+           country_name TEXT,
+           economy      INTEGER,
+           phase        TEXT,
+           cases        REAL""",
+        ["inf_type", "country", "year"],
+        "i",
+        """SELECT i.inf_type, i.country, i.year, it.description, c.name, c.economy, e.phase, i.cases
+           FROM InfectionData i
+           JOIN Infection_Type it ON i.inf_type = it.id
+           JOIN Country c ON i.country = c.CountryID
+           JOIN Economy e ON c.economy = e.economyID
+           {where}""",
+    ),
+}
+
+# The filter and sort paths of the pages: the substring filters arrive as country/antigen/inf_type
+# IN (...) (trigram_index), region and phase as NOCASE equality (lookup_keys)
+INDEXES = {
+    VACCINATION_WIDE: {
+        "listing": "country_name, year DESC",
+        "country": "country, year",
+        "antigen": "antigen, year",
+        "region": "region_name COLLATE NOCASE, country_name, year DESC",
+        "year": "year, country_name",
+    },
+    INFECTION_WIDE: {
+        "listing": "phase, country_name",
+        "country": "country, year",
+        "phase": "phase COLLATE NOCASE, country_name",
+        "year": "year, phase",
+    },
+}
+
+
+def create_wide_tables(conn):
+    for table, (columns, key, _, _) in TABLES.items():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({', '.join(key)}))")
+        for name, index_columns in INDEXES[table].items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} ({index_columns})")
+
+
+def build_wide_tables(conn):
+    """Rebuilds both tables from the fact and dimension tables."""
+    create_wide_tables(conn)
+    for table, (_, _, _, rows) in TABLES.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} " + rows.format(where=""))
+    conn.commit()
+
+
+def ensure_wide_tables(conn):
+    """Builds the tables the first time they are needed."""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not set(TABLES) <= existing:
+        build_wide_tables(conn)
+
+
+def ensure_tables(database=DATABASE_FILE):
+    """ensure_wide_tables() for pages that query through pyhtml; checks the database once per version."""
+    pyhtml.prepare_database(database, ensure_wide_tables)
+
+
+def refresh_rows(conn, table, fact_keys):
+    """Re-reads the given fact rows (tuples of the table's key columns) from the joined source tables."""
+    create_wide_tables(conn)
+    _, key, alias, rows = TABLES[table]
+    match = " AND ".join(f"{column} = ?" for column in key)
+    source_match = " AND ".join(f"{alias}.{column} = ?" for column in key)
+    for fact_key in set(fact_keys):
+        conn.execute(f"DELETE FROM {table} WHERE {match}", fact_key)
+        conn.execute(f"INSERT INTO {table} " + rows.format(where="WHERE " + source_match), fact_key)
+
+
+def refresh_infection_rows(conn, fact_keys):
+    """(inf_type, country, year) keys of changed InfectionData rows."""
+    refresh_rows(conn, INFECTION_WIDE, fact_keys)
+
+
+def refresh_vaccination_rows(conn, fact_keys):
+    """(inf_type, antigen, country, year) keys of changed Vaccination rows."""
+    refresh_rows(conn, VACCINATION_WIDE, fact_keys)
+
+
+def ingest_vaccination_data(rows, database=DATABASE_FILE):
+    """Loads (inf_type, antigen, country, year, target_num, doses, coverage) rows into Vaccination and updates the affected /page2 read rows, dose rollup rows and coverage ranks."""
+    conn = sqlite3.connect(database)
+    try:
+        ensure_wide_tables(conn)
+        rank_tables.ensure_ranks(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO Vaccination (inf_type, antigen, country, year, target_num, doses, coverage) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        fact_keys = [(inf_type, antigen, country, year) for inf_type, antigen, country, year, _, _, _ in rows]
+        refresh_vaccination_rows(conn, fact_keys)
+        region_rollup.refresh_nodes(conn, "doses", [(antigen, country, year) for _, antigen, country, year in fact_keys])
+        rank_tables.refresh_partitions(conn, "coverage", [(antigen, year) for _, antigen, _, year in fact_keys])
+        pyhtml.bump_content_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Rebuild after a bulk load, or after dimension names have changed
+    connection = sqlite3.connect(DATABASE_FILE)
+    build_wide_tables(connection)
+    counts = {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES}
+    connection.close()
+    print("Rebuilt " + ", ".join(f"{table} with {count} rows" for table, count in counts.items()) + ".")